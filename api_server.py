@@ -0,0 +1,386 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+from collections import OrderedDict
+from datetime import date
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import fund_store
+import portfolio_store
+from valuation import value_portfolio
+
+# Read-only HTTP/JSON API over the fund store and the portfolio files.
+#
+#   GET /funds?offset=&limit=                               fund list
+#   GET /funds/<SYMBOL>/prices?start=&end=&offset=&limit=   price range
+#   GET /funds/<SYMBOL>/latest                              latest price
+#   GET /portfolios/<ID>/positions                          open positions
+#   GET /portfolios/<ID>/valuation?offset=&limit=           equity curve and returns
+#
+# Every response carries an ETag derived from the versions of the files it was
+# built from, so conditional requests are answered without building the body,
+# and encoded bodies are shared between clients asking for the same thing.
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# Encoded response bodies kept in memory, keyed by ETag
+RESPONSE_CACHE_SIZE = 512
+
+MAX_HEADER_BYTES = 16 * 1024
+
+# Fund codes as TEFAS issues them; anything else never reaches the file system
+SYMBOL_PATTERN = re.compile(r'^[A-Z0-9]{2,6}$')
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+STATUS_TEXT = {
+    200: 'OK',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    500: 'Internal Server Error',
+}
+
+
+def _file_version(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _portfolio_path(portfolio_id):
+    return portfolio_store.portfolio_path(portfolio_id)
+
+
+_portfolio_cache = {}
+
+
+# Function to read a portfolio ledger through an mtime-keyed cache
+def load_portfolio(portfolio_id):
+    path = _portfolio_path(portfolio_id)
+    version = _file_version(path)
+    if version is None:
+        raise ApiError(404, f"Portfolio {portfolio_id} not found")
+
+    cached = _portfolio_cache.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    try:
+        ledger = portfolio_store.read_portfolio(portfolio_id)
+    except portfolio_store.PortfolioError:
+        # Damaged on disk, serve the last good copy if there is one
+        if cached is not None:
+            return cached[1]
+        raise ApiError(500, f"Portfolio {portfolio_id} is not readable")
+
+    _portfolio_cache[path] = (version, ledger)
+    return ledger
+
+
+_fund_list_cache = {}
+
+
+def load_fund_list():
+    symbols = tuple(fund_store.list_symbols())
+    cached = _fund_list_cache.get('funds')
+    if cached is not None and cached[0] == symbols:
+        return cached[1]
+
+    # Funds only present as legacy JSON are not served (importing them would write)
+    funds = [{'symbol': symbol, 'name': fund_store.read_name(symbol)} for symbol in symbols if fund_store.has_fund(symbol)]
+    _fund_list_cache['funds'] = (symbols, funds)
+    return funds
+
+
+# Function to turn a float into a JSON number; missing (NaN) prices become null
+def _json_number(value):
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def _fund_columns(symbol):
+    columns = fund_store.cached_columns(symbol)
+    if columns is None or len(columns['date']) == 0:
+        raise ApiError(404, f"No data for fund {symbol}")
+    return columns
+
+
+def _query_int(query, name, default, minimum=0, maximum=None):
+    value = query.get(name, [None])[0]
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ApiError(400, f"Parameter '{name}' must be an integer")
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ApiError(400, f"Parameter '{name}' is out of range")
+    return value
+
+
+def _query_date(query, name):
+    value = query.get(name, [None])[0]
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value).toordinal()
+    except ValueError:
+        raise ApiError(400, f"Parameter '{name}' must be a YYYY-MM-DD date")
+
+
+def _page(query):
+    offset = _query_int(query, 'offset', 0)
+    limit = _query_int(query, 'limit', DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+    return offset, limit
+
+
+def _paginated(items_total, offset, limit):
+    next_offset = offset + limit if offset + limit < items_total else None
+    return {'total': items_total, 'offset': offset, 'limit': limit, 'next_offset': next_offset}
+
+
+def fund_list(query):
+    offset, limit = _page(query)
+    funds = load_fund_list()
+    return dict(_paginated(len(funds), offset, limit), funds=funds[offset:offset + limit])
+
+
+def fund_prices(symbol, query):
+    columns = _fund_columns(symbol)
+    offset, limit = _page(query)
+
+    start = _query_date(query, 'start')
+    end = _query_date(query, 'end')
+    first = 0 if start is None else int(columns['date'].searchsorted(start, side='left'))
+    last = len(columns['date']) if end is None else int(columns['date'].searchsorted(end, side='right'))
+    total = max(last - first, 0)
+
+    page_first = first + offset
+    page_last = min(page_first + limit, last)
+    dates = fund_store.ordinals_to_iso(columns['date'][page_first:page_last]).tolist()
+    prices = [_json_number(price) for price in columns['price'][page_first:page_last]]
+
+    return dict(_paginated(total, offset, limit), symbol=symbol, name=fund_store.read_name(symbol),
+                prices=[{'date': day, 'price': price} for day, price in zip(dates, prices)])
+
+
+def fund_latest(symbol):
+    columns = _fund_columns(symbol)
+    return {
+        'symbol': symbol,
+        'name': fund_store.read_name(symbol),
+        'date': str(fund_store.ordinals_to_iso(columns['date'][-1:])[0]),
+        'price': _json_number(columns['price'][-1]),
+    }
+
+
+def portfolio_positions(portfolio_id):
+    quantities = {}
+    for entry in load_portfolio(portfolio_id):
+        if entry.get('type') == 'buy':
+            quantities[entry['symbol']] = quantities.get(entry['symbol'], 0) + entry['quantity']
+        elif entry.get('type') == 'sell':
+            quantities[entry['symbol']] = quantities.get(entry['symbol'], 0) - entry['quantity']
+
+    positions = []
+    for symbol, quantity in sorted(quantities.items()):
+        if quantity <= 0:
+            continue
+        columns = fund_store.cached_columns(symbol)
+        price = _json_number(columns['price'][-1]) if columns is not None and len(columns['price']) else None
+        positions.append({
+            'symbol': symbol,
+            'quantity': quantity,
+            'price': price,
+            'value': price * quantity if price is not None else None,
+        })
+    return {'portfolio_id': portfolio_id, 'positions': positions}
+
+
+def portfolio_valuation(portfolio_id, query):
+    offset, limit = _page(query)
+    result = value_portfolio(load_portfolio(portfolio_id))
+    if result is None:
+        return dict(_paginated(0, offset, limit), portfolio_id=portfolio_id, equity_curve=[])
+
+    dates = fund_store.ordinals_to_iso(result['dates'][offset:offset + limit]).tolist()
+    equity = result['equity'][offset:offset + limit].tolist()
+    drawdowns = result['drawdown'][offset:offset + limit].tolist()
+    return dict(
+        _paginated(len(result['dates']), offset, limit),
+        portfolio_id=portfolio_id,
+        value=float(result['equity'][-1]),
+        time_weighted_return=result['time_weighted_return'],
+        money_weighted_return=result['money_weighted_return'],
+        max_drawdown=float(result['drawdown'].min()),
+        equity_curve=[{'date': day, 'value': value, 'drawdown': dd} for day, value, dd in zip(dates, equity, drawdowns)],
+    )
+
+
+# Function to map a request to (ETag source versions, body builder)
+def route(path, query):
+    parts = [unquote(part) for part in path.strip('/').split('/') if part]
+
+    if parts == ['funds']:
+        return ('funds', tuple(fund_store.list_symbols())), lambda: fund_list(query)
+
+    if len(parts) == 3 and parts[0] == 'funds':
+        symbol = parts[1].upper()
+        if not SYMBOL_PATTERN.match(symbol) or not fund_store.has_fund(symbol):
+            raise ApiError(404, f"Unknown fund {parts[1]}")
+        version = fund_store.data_version(symbol)
+        if parts[2] == 'prices':
+            return ('prices', symbol, version), lambda: fund_prices(symbol, query)
+        if parts[2] == 'latest':
+            return ('latest', symbol, version), lambda: fund_latest(symbol)
+
+    if len(parts) == 3 and parts[0] == 'portfolios' and parts[1].isdigit():
+        portfolio_id = int(parts[1])
+        ledger_version = _file_version(_portfolio_path(portfolio_id))
+        if ledger_version is None:
+            raise ApiError(404, f"Portfolio {portfolio_id} not found")
+        # Positions and valuations also depend on the prices of every symbol in the ledger
+        symbols = sorted({entry.get('symbol') for entry in load_portfolio(portfolio_id) if entry.get('symbol')})
+        versions = (ledger_version, tuple(fund_store.data_version(symbol) for symbol in symbols))
+        if parts[2] == 'positions':
+            return ('positions', portfolio_id, versions), lambda: portfolio_positions(portfolio_id)
+        if parts[2] == 'valuation':
+            return ('valuation', portfolio_id, versions, date.today().toordinal()), lambda: portfolio_valuation(portfolio_id, query)
+
+    raise ApiError(404, f"Unknown endpoint {path}")
+
+
+class ApiServer:
+    def __init__(self, host='127.0.0.1', port=8000):
+        self.host = host
+        self.port = port
+        self.response_cache = OrderedDict()
+        # The API is read-only: GETs must never import (and so write) legacy funds
+        fund_store.AUTO_IMPORT_LEGACY = False
+
+    def _etag(self, target, versions):
+        digest = hashlib.sha1(repr((target, versions)).encode('utf-8')).hexdigest()
+        return f'"{digest}"'
+
+    def _cached_body(self, etag):
+        body = self.response_cache.get(etag)
+        if body is not None:
+            self.response_cache.move_to_end(etag)
+        return body
+
+    def _remember_body(self, etag, body):
+        self.response_cache[etag] = body
+        if len(self.response_cache) > RESPONSE_CACHE_SIZE:
+            self.response_cache.popitem(last=False)
+
+    async def handle_request(self, method, target, headers):
+        if method not in ('GET', 'HEAD'):
+            raise ApiError(405, f"Method {method} not allowed")
+
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        # Routing stats the store (and parses ledgers), keep that off the event loop too
+        loop = asyncio.get_running_loop()
+        versions, build = await loop.run_in_executor(None, route, url.path, query)
+        etag = self._etag(target, versions)
+
+        if etag in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+            return 304, None, etag
+
+        body = self._cached_body(etag)
+        if body is None:
+            # Building a body can read files, keep that off the event loop
+            payload = await loop.run_in_executor(None, build)
+            body = json.dumps(payload, ensure_ascii=False, allow_nan=False).encode('utf-8')
+            self._remember_body(etag, body)
+        return 200, body, etag
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    await self.write_response(writer, 400, json.dumps({'error': 'Malformed request'}).encode('utf-8'), None, keep_alive=False)
+                    break
+
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+                try:
+                    status, body, etag = await self.handle_request(method, target, headers)
+                except ApiError as e:
+                    status, body, etag = e.status, json.dumps({'error': e.message}).encode('utf-8'), None
+                except Exception as e:
+                    print(f"Error handling {method} {target}: {e}")
+                    status, body, etag = 500, json.dumps({'error': 'Internal error'}).encode('utf-8'), None
+
+                await self.write_response(writer, status, body, etag, keep_alive, send_body=method != 'HEAD')
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def write_response(self, writer, status, body, etag, keep_alive, send_body=True):
+        lines = [
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body) if body is not None else 0}",
+            "Cache-Control: no-cache",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if etag:
+            lines.append(f"ETag: {etag}")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if body is not None and send_body:
+            writer.write(body)
+        await writer.drain()
+
+    async def serve_forever(self):
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port, limit=MAX_HEADER_BYTES)
+        print(f"Serving fund data on http://{self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-only HTTP/JSON API over fund and portfolio data")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(ApiServer(args.host, args.port).serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,129 @@
+from collections import OrderedDict
+
+import numpy as np
+
+import fund_store
+from sim import rolling_rsi
+
+# Chart overlays computed on demand from the cached price arrays. Every result
+# is memoized per (fund, indicator, params, date range) and tied to the
+# version of the fund's files, so toggling overlays or switching the charted
+# range only computes what has not been computed before, and a fund is only
+# re-read when it actually changed.
+#
+# Indicators are computed over the fund's whole history and then cut to the
+# range, so a moving average starts with real values at the left edge.
+
+MEMO_SIZE = 512
+
+_memo = OrderedDict()
+
+
+# Function to convert date ordinals to datetime64 values for plotting
+def to_datetime64(ordinals):
+    return (np.asarray(ordinals, dtype=np.int64) - fund_store.EPOCH_ORDINAL).astype('datetime64[D]')
+
+
+def sma(prices, window):
+    result = np.full(len(prices), np.nan)
+    if len(prices) >= window:
+        sums = np.cumsum(np.concatenate([[0.0], prices]))
+        result[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return result
+
+
+def ema(prices, span):
+    alpha = 2.0 / (span + 1)
+    result = np.empty(len(prices))
+    value = prices[0] if len(prices) else 0.0
+    for i, price in enumerate(prices):
+        value = alpha * price + (1 - alpha) * value
+        result[i] = value
+    return result
+
+
+def bollinger(prices, window, width):
+    middle = sma(prices, window)
+    std = np.full(len(prices), np.nan)
+    if len(prices) >= window:
+        squares = np.cumsum(np.concatenate([[0.0], prices ** 2]))
+        mean_square = (squares[window:] - squares[:-window]) / window
+        std[window - 1:] = np.sqrt(np.maximum(mean_square - middle[window - 1:] ** 2, 0))
+    return np.stack([middle, middle + width * std, middle - width * std])
+
+
+def rsi(prices, period):
+    return rolling_rsi(prices[:, None], period, saturate=True)[:, 0]
+
+
+# Indicator name -> function(prices, *params) over the whole history
+INDICATORS = {
+    'sma': sma,
+    'ema': ema,
+    'bollinger': bollinger,
+    'rsi': rsi,
+}
+
+
+def _remember(key, version, compute):
+    cached = _memo.get(key)
+    if cached is not None and cached[0] == version:
+        _memo.move_to_end(key)
+        return cached[1]
+    value = compute()
+    _memo[key] = (version, value)
+    if len(_memo) > MEMO_SIZE:
+        _memo.popitem(last=False)
+    return value
+
+
+def _range_slice(dates, start, end):
+    first = 0 if start is None else int(np.searchsorted(dates, start))
+    last = len(dates) if end is None else int(np.searchsorted(dates, end, side='right'))
+    return slice(first, last)
+
+
+# Function to get a fund's (date ordinals, prices) within [start, end] (ordinals, inclusive)
+def price_series(symbol, start=None, end=None):
+    columns = fund_store.cached_columns(symbol)
+    if columns is None:
+        return np.empty(0, dtype=np.int32), np.empty(0)
+    window = _range_slice(columns['date'], start, end)
+    return columns['date'][window], columns['price'][window]
+
+
+# Function to get an indicator for a fund within [start, end]. Returns the dates
+# and the values (one row per line for multi-line indicators such as bollinger).
+def overlay(symbol, indicator, params=(), start=None, end=None):
+    version = fund_store.data_version(symbol)
+    params = tuple(params)
+
+    def compute_full():
+        dates, prices = price_series(symbol)
+        return dates, INDICATORS[indicator](prices, *params) if len(prices) else np.empty(0)
+
+    def compute_range():
+        dates, values = _remember((symbol, indicator, params, None, None), version, compute_full)
+        window = _range_slice(dates, start, end)
+        return dates[window], values[..., window]
+
+    return _remember((symbol, indicator, params, start, end), version, compute_range)
+
+
+# Function to get a fund's prices rebased to 100 at the first day of [start, end]
+def normalized(symbol, start=None, end=None):
+    version = fund_store.data_version(symbol)
+
+    def compute():
+        dates, prices = price_series(symbol, start, end)
+        known = np.flatnonzero(prices > 0)
+        if len(known) == 0:
+            return dates, np.full(len(prices), np.nan)
+        return dates, prices / prices[known[0]] * 100.0
+
+    return _remember((symbol, 'normalized', (), start, end), version, compute)
+
+
+# Function to get normalized series for several funds (e.g. a comparison plus a benchmark)
+def comparison(symbols, start=None, end=None):
+    return {symbol: normalized(symbol, start, end) for symbol in symbols}
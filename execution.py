@@ -0,0 +1,170 @@
+import numpy as np
+
+import snapshot_archive
+
+# Execution layer for the backtest engine. A strategy hands over the fund it
+# wants to hold on every trading day (a column of the price panel, -1 for cash)
+# and the layer turns that into executed trades with settlement delays, entry
+# and exit fees, withholding tax on gains and optional whole-share rounding.
+#
+# Per-day work is done with array operations over the whole run; the only
+# Python loops run over trades, which are orders of magnitude fewer than days.
+
+CASH = -1
+
+# Withholding tax on realized gains by fund type
+DEFAULT_TAX_RATES = {
+    'equity': 0.0,       # hisse senedi yoğun fonlar
+    'default': 0.10,
+}
+
+
+# Archive categories (ASCII-folded, lower case) of funds taxed as equity funds
+EQUITY_CATEGORY = 'hisse senedi'
+
+
+# Function to get the fund type of every fund from its latest archived category
+def fund_types_from_archive(symbols=None):
+    categories = snapshot_archive.latest_values('category', symbols)
+    return {symbol: 'equity' if EQUITY_CATEGORY in category.translate(snapshot_archive.TURKISH_ASCII).lower() else 'default'
+            for symbol, category in categories.items()}
+
+
+class ExecutionModel:
+    def __init__(self, entry_fee=0.0, exit_fee=0.0, settlement_days=None, default_settlement_days=1,
+                 tax_rates=None, fund_types=None, whole_shares=False):
+        # Fees are fractions of the traded amount, settlement is in trading days
+        self.entry_fee = entry_fee
+        self.exit_fee = exit_fee
+        self.settlement_days = settlement_days or {}
+        self.default_settlement_days = default_settlement_days
+        self.tax_rates = tax_rates or DEFAULT_TAX_RATES
+        self.fund_types = fund_types or {}
+        self.whole_shares = whole_shares
+
+    def settlement_lags(self, symbols):
+        return np.array([self.settlement_days.get(symbol, self.default_settlement_days) for symbol in symbols], dtype=np.int64)
+
+    def tax_rates_for(self, symbols):
+        default = self.tax_rates['default']
+        return np.array([self.tax_rates.get(self.fund_types.get(symbol), default) for symbol in symbols])
+
+
+# Function to turn daily targets into a trade schedule. A new target is only
+# acted on once the previous switch has fully settled; a target that arrives
+# earlier is kept pending and carried out as soon as the switch settles.
+def schedule_trades(targets, lags):
+    days = len(targets)
+    previous = np.concatenate([[CASH], targets[:-1]])
+    signal_days = np.flatnonzero(targets != previous)
+
+    funds, buy_days, sell_days = [], [], []
+    held = CASH
+    ready_day = 0
+    day = signal_days[0] if len(signal_days) else days
+    while day < days:
+        target = targets[day]
+        if target != held:
+            # Selling the current fund settles after its lag, the new fund is bought with the proceeds
+            sell_day = day + (lags[held] if held != CASH else 0)
+            if held != CASH:
+                sell_days.append(sell_day)
+            if target != CASH:
+                buy_day = sell_day + lags[target]
+                if buy_day >= days:
+                    break
+                funds.append(target)
+                buy_days.append(buy_day)
+                ready_day = buy_day
+            else:
+                ready_day = sell_day
+            held = target
+
+        # The latest target as of the settlement day is pending if it differs
+        # from the holding; otherwise wait for the next signal after settlement
+        if day < ready_day < days and targets[ready_day] != held:
+            day = ready_day
+        else:
+            next_signal = np.searchsorted(signal_days, max(day, ready_day), side='right')
+            day = signal_days[next_signal] if next_signal < len(signal_days) else days
+
+    # Holdings still open at the end are marked to market on the last day
+    sell_days = [min(day, days - 1) for day in sell_days]
+    return np.array(funds, dtype=np.int64), np.array(buy_days, dtype=np.int64), np.array(sell_days[:len(funds)], dtype=np.int64)
+
+
+# Function to simulate executing daily fund targets over a (forward-filled) price panel
+def execute(targets, prices, symbols, starting_cash, model):
+    days = len(targets)
+    targets = np.asarray(targets, dtype=np.int64)
+    funds, buy_days, sell_days = schedule_trades(targets, model.settlement_lags(symbols))
+
+    holdings = len(funds)
+    closed = len(sell_days)
+    exit_days = np.append(sell_days, days - 1) if holdings > closed else sell_days
+
+    entry_prices = prices[buy_days, funds]
+    exit_prices = prices[exit_days, funds]
+    tax_rates = model.tax_rates_for(symbols)[funds] if holdings else np.empty(0)
+
+    if model.whole_shares:
+        shares, residual, proceeds, taxes = _whole_share_holdings(starting_cash, entry_prices, exit_prices, tax_rates, model)
+    else:
+        # Every holding grows the invested cash by a factor that does not depend
+        # on the amount, so the cash carried from trade to trade is a cumulative product
+        price_ratio = exit_prices / entry_prices
+        factors = (price_ratio * (1 - model.exit_fee) - tax_rates * np.maximum(price_ratio - 1, 0)) / (1 + model.entry_fee)
+        invested = starting_cash * np.concatenate([[1.0], np.cumprod(factors)[:-1]])
+        shares = invested / (entry_prices * (1 + model.entry_fee))
+        residual = np.zeros(holdings)
+        taxes = tax_rates * np.maximum(shares * (exit_prices - entry_prices), 0)
+        proceeds = shares * exit_prices * (1 - model.exit_fee) - taxes
+
+    # Entry fees are paid on every purchase, exit fees and tax only on closed holdings
+    entry_fees = shares * entry_prices * model.entry_fee
+    exit_fees = shares[:closed] * exit_prices[:closed] * model.exit_fee
+
+    # Daily equity: the active holding's market value plus any uninvested cash,
+    # otherwise the cash from the last sale (or the starting cash)
+    day_index = np.arange(days)
+    holding = np.searchsorted(buy_days, day_index, side='right') - 1
+    active = holding >= 0
+    active[active] &= day_index[active] < exit_days[holding[active]]
+
+    cash_after = np.concatenate([[starting_cash], proceeds + residual])
+    settled = np.searchsorted(exit_days[:closed], day_index, side='right')
+    equity = cash_after[settled].astype(np.float64)
+    if holdings:
+        held_prices = prices[day_index[active], funds[holding[active]]]
+        equity[active] = residual[holding[active]] + shares[holding[active]] * held_prices
+    # An open holding on the final day is worth its market value before exit costs
+    if holdings > closed:
+        equity[-1] = residual[-1] + shares[-1] * prices[-1, funds[-1]]
+
+    return {
+        'equity': equity,
+        'funds': funds,
+        'buy_days': buy_days,
+        'sell_days': sell_days,
+        'shares': shares,
+        'fees': float(np.sum(entry_fees) + np.sum(exit_fees)),
+        'taxes': float(np.sum(taxes[:closed])),
+        'final_value': float(equity[-1]),
+    }
+
+
+def _whole_share_holdings(starting_cash, entry_prices, exit_prices, tax_rates, model):
+    # Rounding down to whole shares leaves cash behind, which makes each trade
+    # depend on the previous one: this loop runs once per trade
+    count = len(entry_prices)
+    shares, residual, proceeds, taxes = (np.zeros(count) for _ in range(4))
+    cash = starting_cash
+    for k in range(count):
+        shares[k] = np.floor(cash / (entry_prices[k] * (1 + model.entry_fee)))
+        cost = shares[k] * entry_prices[k]
+        residual[k] = cash - cost * (1 + model.entry_fee)
+        gross = shares[k] * exit_prices[k]
+        taxes[k] = tax_rates[k] * max(gross - cost, 0)
+        proceeds[k] = gross * (1 - model.exit_fee) - taxes[k]
+        cash = proceeds[k] + residual[k]
+    return shares, residual, proceeds, taxes
@@ -0,0 +1,206 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+from datetime import date
+
+import numpy as np
+
+import fund_store
+
+# Streaming export of price histories from the store. Funds are read one at a
+# time and rows are written in fixed-size chunks, so memory stays bounded by
+# one fund plus one chunk regardless of how much is exported.
+#
+# Two formats are supported:
+#   csv     one row per fund and day, optionally gzip-compressed
+#   fcol    chunked columnar binary: a magic line, then chunks of
+#           <u4 header length><JSON header><one block per column>, ended by a
+#           zero length. Column blocks are raw little-endian arrays, optionally
+#           zlib-compressed; symbols are stored as int32 indexes into the
+#           chunk header's symbol list. Read back with iter_fcol().
+
+DEFAULT_CHUNK_ROWS = 65536
+PROGRESS_INTERVAL = 2.0
+
+# Favour throughput over ratio; the default level 9 is several times slower
+GZIP_LEVEL = 6
+
+FCOL_MAGIC = b'FCOL1\n'
+FCOL_LENGTH = struct.Struct('<I')
+
+# Exported columns after Symbol and Date, with their CSV header names
+VALUE_COLUMNS = [(column, key) for column, (key, _) in fund_store.COLUMNS.items() if column != 'date']
+
+
+# Function to yield the stored rows of the given funds in chunks of at most chunk_rows
+def iter_chunks(symbols, start=None, end=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    start_ordinal = None if start is None else start.toordinal()
+    end_ordinal = None if end is None else end.toordinal()
+    pending, pending_rows = [], 0
+
+    for symbol in symbols:
+        columns = fund_store.read_columns(symbol)
+        if columns is None:
+            continue
+        first = 0 if start_ordinal is None else np.searchsorted(columns['date'], start_ordinal)
+        last = len(columns['date']) if end_ordinal is None else np.searchsorted(columns['date'], end_ordinal, side='right')
+
+        while first < last:
+            take = min(last - first, chunk_rows - pending_rows)
+            part = {column: values[first:first + take] for column, values in columns.items()}
+            part['symbol'] = symbol
+            pending.append(part)
+            pending_rows += take
+            first += take
+            if pending_rows == chunk_rows:
+                yield _join(pending)
+                pending, pending_rows = [], 0
+
+    if pending:
+        yield _join(pending)
+
+
+def _join(parts):
+    chunk = {column: np.concatenate([part[column] for part in parts]) for column in fund_store.COLUMNS}
+    chunk['symbols'] = [part['symbol'] for part in parts]
+    chunk['symbol_index'] = np.repeat(np.arange(len(parts), dtype=np.int32), [len(part['date']) for part in parts])
+    return chunk
+
+
+class CsvWriter:
+    def __init__(self, path, compress=False):
+        raw = gzip.open(path, 'wb', compresslevel=GZIP_LEVEL) if compress else open(path, 'wb')
+        self.text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        self.writer = csv.writer(self.text)
+        self.writer.writerow(['Symbol', 'Date'] + [key for _, key in VALUE_COLUMNS])
+
+    def write(self, chunk):
+        symbols = np.array(chunk['symbols'], dtype=object)[chunk['symbol_index']]
+        columns = [symbols, fund_store.ordinals_to_iso(chunk['date'])]
+        for column, _ in VALUE_COLUMNS:
+            values = chunk[column]
+            # Missing values are written as empty fields
+            columns.append(np.where(np.isnan(values), '', values.astype(str)))
+        self.writer.writerows(zip(*(values.tolist() for values in columns)))
+
+    def close(self):
+        self.text.close()
+
+
+class FcolWriter:
+    def __init__(self, path, compress=False):
+        self.file = open(path, 'wb')
+        self.compress = compress
+        self.file.write(FCOL_MAGIC)
+
+    def write(self, chunk):
+        arrays = [('symbol', chunk['symbol_index'])] + [(column, chunk[column]) for column in fund_store.COLUMNS]
+        blocks, columns = [], []
+        for name, values in arrays:
+            block = np.ascontiguousarray(values).astype(values.dtype.newbyteorder('<')).tobytes()
+            if self.compress:
+                block = zlib.compress(block, 1)
+            blocks.append(block)
+            columns.append({'name': name, 'dtype': values.dtype.newbyteorder('<').str, 'nbytes': len(block)})
+
+        header = json.dumps({
+            'rows': len(chunk['date']),
+            'symbols': chunk['symbols'],
+            'compression': 'zlib' if self.compress else None,
+            'columns': columns,
+        }).encode('utf-8')
+        self.file.write(FCOL_LENGTH.pack(len(header)))
+        self.file.write(header)
+        for block in blocks:
+            self.file.write(block)
+
+    def close(self):
+        self.file.write(FCOL_LENGTH.pack(0))
+        self.file.close()
+
+
+WRITERS = {
+    'csv': CsvWriter,
+    'fcol': FcolWriter,
+}
+
+
+# Function to read an fcol file back chunk by chunk (dicts of column arrays)
+def iter_fcol(path):
+    with open(path, 'rb') as f:
+        if f.read(len(FCOL_MAGIC)) != FCOL_MAGIC:
+            raise ValueError(f"{path} is not an fcol file")
+        while True:
+            length = FCOL_LENGTH.unpack(f.read(FCOL_LENGTH.size))[0]
+            if length == 0:
+                return
+            header = json.loads(f.read(length))
+            chunk = {}
+            for column in header['columns']:
+                block = f.read(column['nbytes'])
+                if header['compression'] == 'zlib':
+                    block = zlib.decompress(block)
+                chunk[column['name']] = np.frombuffer(block, dtype=column['dtype'])
+            chunk['symbol'] = np.array(header['symbols'], dtype=str)[chunk['symbol']]
+            yield chunk
+
+
+# Function to export funds (all by default) between start and end to path.
+# Returns throughput statistics; progress is reported every PROGRESS_INTERVAL seconds.
+def export(path, symbols=None, start=None, end=None, fmt='csv', compress=False,
+           chunk_rows=DEFAULT_CHUNK_ROWS, progress=True):
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    symbols = fund_store.list_symbols() if symbols is None else list(symbols)
+
+    writer = WRITERS[fmt](path, compress=compress)
+    started = last_report = time.monotonic()
+    rows = 0
+    try:
+        for chunk in iter_chunks(symbols, start, end, chunk_rows):
+            writer.write(chunk)
+            rows += len(chunk['date'])
+            now = time.monotonic()
+            if progress and now - last_report >= PROGRESS_INTERVAL:
+                print(f"Exported {rows} rows ({rows / (now - started):.0f} rows/s)")
+                last_report = now
+    finally:
+        writer.close()
+
+    elapsed = time.monotonic() - started
+    stats = {
+        'rows': rows,
+        'funds': len(symbols),
+        'seconds': elapsed,
+        'rows_per_second': rows / elapsed if elapsed > 0 else 0.0,
+        'bytes': os.path.getsize(path),
+    }
+    if progress:
+        print(f"Exported {rows} rows of {len(symbols)} funds to {path} in {elapsed:.1f}s "
+              f"({stats['rows_per_second']:.0f} rows/s, {stats['bytes'] / 1e6:.1f} MB)")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export fund price histories from the store")
+    parser.add_argument('output')
+    parser.add_argument('--format', choices=sorted(WRITERS), default='csv')
+    parser.add_argument('--symbols', help="comma separated fund symbols (default: all)")
+    parser.add_argument('--start', type=date.fromisoformat)
+    parser.add_argument('--end', type=date.fromisoformat)
+    parser.add_argument('--compress', action='store_true', help="gzip the CSV / zlib the fcol column blocks")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    symbols = args.symbols.split(',') if args.symbols else None
+    try:
+        export(args.output, symbols, args.start, args.end, args.format, args.compress, args.chunk_rows)
+    except ValueError as e:
+        sys.exit(str(e))
@@ -0,0 +1,96 @@
+import json
+import os
+from datetime import date, timedelta
+
+import numpy as np
+
+import fund_store
+from trading_calendar import MAX_HOLIDAY_GAP_DAYS, get_trading_calendar
+
+# Coverage index: the date ranges (inclusive ordinal pairs) that were fetched
+# successfully for each fund, kept next to the fund's columns in the store.
+# Comparing it against the trading calendar tells which windows still need fetching.
+
+def _coverage_path(symbol):
+    return os.path.join(fund_store.fund_dir(symbol), 'coverage.json')
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+# Function to derive coverage from the dates already in the store (for data fetched
+# before coverage was tracked). Gaps longer than any holiday are treated as holes.
+def _seed_from_store(symbol):
+    columns = fund_store.read_columns(symbol)
+    if columns is None or len(columns['date']) == 0:
+        return []
+
+    dates = columns['date'].astype(np.int64)
+    breaks = np.flatnonzero(np.diff(dates) > MAX_HOLIDAY_GAP_DAYS)
+    starts = np.concatenate([dates[:1], dates[breaks + 1]])
+    ends = np.concatenate([dates[breaks], dates[-1:]])
+    return [[int(start), int(end)] for start, end in zip(starts, ends)]
+
+
+def load_coverage(symbol):
+    try:
+        with open(_coverage_path(symbol), 'r', encoding='utf-8') as f:
+            return merge_ranges(json.load(f))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return _seed_from_store(symbol)
+
+
+def save_coverage(symbol, ranges):
+    os.makedirs(fund_store.fund_dir(symbol), exist_ok=True)
+    tmp_path = f"{_coverage_path(symbol)}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(merge_ranges(ranges), f)
+    os.replace(tmp_path, _coverage_path(symbol))
+
+
+# Function to record that [start_date, end_date] was fetched successfully
+def mark_covered(symbol, start_date, end_date):
+    ranges = load_coverage(symbol)
+    ranges.append([start_date.toordinal(), end_date.toordinal()])
+    save_coverage(symbol, ranges)
+
+
+# Function to list the uncovered (start_date, end_date) ranges of a fund that contain trading days
+def missing_ranges(symbol, start_date, end_date, calendar=None):
+    if calendar is None:
+        calendar = get_trading_calendar()
+    missing = []
+    cursor = start_date.toordinal()
+    last = end_date.toordinal()
+
+    for covered_start, covered_end in load_coverage(symbol):
+        if covered_end < cursor:
+            continue
+        if covered_start > last:
+            break
+        if covered_start > cursor:
+            missing.append((cursor, covered_start - 1))
+        cursor = covered_end + 1
+    if cursor <= last:
+        missing.append((cursor, last))
+
+    return [(date.fromordinal(start), date.fromordinal(end))
+            for start, end in missing if calendar.count(start, end) > 0]
+
+
+# Function to split ranges into request windows of at most window_days days
+def split_windows(ranges, window_days=90):
+    windows = []
+    for start_date, end_date in ranges:
+        while start_date <= end_date:
+            window_end = min(start_date + timedelta(days=window_days), end_date)
+            windows.append((start_date, window_end))
+            start_date = window_end + timedelta(days=1)
+    return windows
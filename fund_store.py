@@ -0,0 +1,411 @@
+import json
+import os
+import re
+import shutil
+import threading
+from datetime import date
+
+import numpy as np
+
+from file_lock import exclusive_lock
+
+# Columnar price history: one directory per fund holding a raw binary file per
+# column plus a small meta.json with the fund name. Batches are appended as they
+# arrive; readers sort by date and keep the last value written for each date.
+#
+# Rewrites (compaction, spike removal) never touch the live files. They write a
+# new generation directory (g<N>/) and switch to it by atomically replacing
+# manifest.json, so a crash or a reader in another process only ever sees one
+# whole generation. Funds without a manifest keep their columns directly in the
+# fund directory, as written before generations existed.
+LEGACY_DIR = 'funds'
+STORE_DIR = os.path.join('funds', 'columns')
+
+# Readers import a fund's legacy JSON file on first read. Read-only processes
+# (the API server) turn this off and treat such funds as missing.
+AUTO_IMPORT_LEGACY = True
+
+# Times a read is retried when a rewrite switches generations underneath it
+READ_RETRIES = 5
+
+_GENERATION_DIR = re.compile(r'^g\d+$')
+
+# Column name -> (legacy row key, dtype)
+COLUMNS = {
+    'date': ('Date', np.int32),
+    'price': ('Price', np.float64),
+    'shares': ('Number_of_Shares', np.float64),
+    'investors': ('Number_of_Investors', np.float64),
+    'portfolio_size': ('Portfolio_Size', np.float64),
+    'market_price': ('Stock_Market_Price', np.float64),
+}
+
+# Dates are stored as proleptic Gregorian ordinals (date.toordinal())
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def ordinals_to_iso(ordinals):
+    days = np.asarray(ordinals, dtype=np.int64) - EPOCH_ORDINAL
+    return np.datetime_as_string(days.astype('datetime64[D]'), unit='D')
+
+
+def iso_to_ordinals(iso_dates):
+    days = np.asarray(iso_dates, dtype='datetime64[D]').astype(np.int64)
+    return (days + EPOCH_ORDINAL).astype(np.int32)
+
+
+# Function to convert scraped values to floats, falling back to NaN for anything unparsable
+def to_float_array(values):
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        result = np.empty(len(values), dtype=np.float64)
+        for i, value in enumerate(values):
+            try:
+                result[i] = float(value)
+            except (TypeError, ValueError):
+                result[i] = np.nan
+        return result
+
+
+# Lock serializing writes to one fund across threads (backfill, the live price
+# poller, compaction) and processes (the GUI, main.py, cron jobs). Reentrant
+# within a thread; the file lock is taken by the outermost acquisition only.
+class _SymbolLock:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file_lock = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                os.makedirs(fund_dir(self.symbol), exist_ok=True)
+                file_lock = exclusive_lock(os.path.join(fund_dir(self.symbol), 'store'))
+                file_lock.__enter__()
+            except BaseException:
+                self._thread_lock.release()
+                raise
+            self._file_lock = file_lock
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        try:
+            if self._depth == 0:
+                file_lock, self._file_lock = self._file_lock, None
+                file_lock.__exit__(*exc_info)
+        finally:
+            self._thread_lock.release()
+
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+# Function to get the lock serializing writes to a fund
+def symbol_lock(symbol):
+    with _locks_guard:
+        return _locks.setdefault(symbol, _SymbolLock(symbol))
+
+
+def fund_dir(symbol):
+    return os.path.join(STORE_DIR, symbol)
+
+
+def _manifest_path(symbol):
+    return os.path.join(fund_dir(symbol), 'manifest.json')
+
+
+# Function to get a fund's current generation (None for the layout without a manifest)
+def _generation(symbol):
+    try:
+        with open(_manifest_path(symbol), 'r', encoding='utf-8') as f:
+            return json.load(f)['generation']
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None
+
+
+def _generation_dir(symbol, generation):
+    return fund_dir(symbol) if generation is None else os.path.join(fund_dir(symbol), f"g{generation}")
+
+
+def _column_path(directory, column):
+    return os.path.join(directory, f"{column}.bin")
+
+
+def _meta_path(symbol):
+    return os.path.join(fund_dir(symbol), 'meta.json')
+
+
+def has_fund(symbol):
+    return os.path.exists(_column_path(_generation_dir(symbol, _generation(symbol)), 'date'))
+
+
+def read_name(symbol):
+    try:
+        with open(_meta_path(symbol), 'r', encoding='utf-8') as f:
+            return json.load(f).get('name', '')
+    except (FileNotFoundError, json.JSONDecodeError):
+        return ''
+
+
+def write_name(symbol, name):
+    if not name or read_name(symbol) == name:
+        return
+    os.makedirs(fund_dir(symbol), exist_ok=True)
+    tmp_path = f"{_meta_path(symbol)}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'name': name}, f, ensure_ascii=False)
+    os.replace(tmp_path, _meta_path(symbol))
+
+
+# Function to cut the tail of an interrupted append so columns line up again
+def _drop_incomplete_rows(directory):
+    date_path = _column_path(directory, 'date')
+    if not os.path.exists(date_path):
+        return
+    count = os.path.getsize(date_path) // np.dtype(COLUMNS['date'][1]).itemsize
+    for column, (_, dtype) in COLUMNS.items():
+        path = _column_path(directory, column)
+        size = count * np.dtype(dtype).itemsize
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            os.truncate(path, size)
+
+
+# Function to append a batch of rows (dict of equally long column arrays) to a fund
+def append_batch(symbol, columns, name=None):
+    count = len(columns['date'])
+    if count == 0:
+        return 0
+
+    with symbol_lock(symbol):
+        os.makedirs(fund_dir(symbol), exist_ok=True)
+        write_name(symbol, name)
+        directory = _generation_dir(symbol, _generation(symbol))
+        os.makedirs(directory, exist_ok=True)
+        _drop_incomplete_rows(directory)
+
+        # The date column is written last: a batch only becomes visible once it is complete
+        for column in list(COLUMNS)[1:] + ['date']:
+            dtype = COLUMNS[column][1]
+            values = columns.get(column)
+            if values is None:
+                values = np.full(count, np.nan)
+            with open(_column_path(directory, column), 'ab') as f:
+                f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+    return count
+
+
+def _read_column(directory, column):
+    path = _column_path(directory, column)
+    dtype = COLUMNS[column][1]
+    # Size and contents come from one open file, which a rewrite can unlink but not change
+    try:
+        with open(path, 'rb') as f:
+            count = os.fstat(f.fileno()).st_size // np.dtype(dtype).itemsize
+            if count:
+                return np.fromfile(f, dtype=dtype, count=count)
+    except FileNotFoundError:
+        pass
+    return np.empty(0, dtype=dtype)
+
+
+# Function to read columns from a single generation: if a rewrite switched
+# generations during the read, the read is repeated on the new one
+def _read_generation(symbol, columns):
+    for _ in range(READ_RETRIES):
+        generation = _generation(symbol)
+        directory = _generation_dir(symbol, generation)
+        values = {column: _read_column(directory, column) for column in columns}
+        if _generation(symbol) == generation:
+            return values
+    raise OSError(f"Columns of {symbol} kept changing while being read")
+
+
+def _read_raw_columns(symbol):
+    raw = _read_generation(symbol, COLUMNS)
+
+    # The date column is written last, so it holds the number of complete rows.
+    # Longer columns carry the tail of an interrupted append, shorter ones went missing.
+    count = len(raw['date'])
+    for column, values in raw.items():
+        if len(values) >= count:
+            raw[column] = values[:count]
+        else:
+            raw[column] = np.concatenate([values, np.full(count - len(values), np.nan)])
+    return raw
+
+
+def sort_and_dedup(columns):
+    dates = columns['date']
+    # Data written by compact() is already clean; checking is much cheaper than sorting
+    if len(dates) < 2 or np.all(dates[1:] > dates[:-1]):
+        return columns
+    order = np.argsort(dates, kind='stable')
+    sorted_dates = dates[order]
+    # Keep the last row written for each date
+    keep = np.ones(len(order), dtype=bool)
+    keep[:-1] = sorted_dates[1:] != sorted_dates[:-1]
+    index = order[keep]
+    return {column: values[index] for column, values in columns.items()}
+
+
+# Function to import a legacy funds/<symbol>.json file into the columnar store
+def import_legacy_json(symbol):
+    legacy_path = os.path.join(LEGACY_DIR, f"{symbol}.json")
+    try:
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 0
+
+    if not rows:
+        return 0
+
+    # Legacy rows go through the same checks and cleaning as fetched ones
+    # (imported here because normalize builds on this module)
+    import normalize
+
+    columns = {'date': iso_to_ordinals([row['Date'] for row in rows])}
+    for column, (key, _) in list(COLUMNS.items())[1:]:
+        columns[column] = to_float_array([row.get(key) for row in rows])
+    columns, _ = normalize.normalize_history_columns(columns)
+    written = append_batch(symbol, columns, name=rows[0].get('Name'))
+    if written:
+        normalize.clean_fund(symbol)
+    return written
+
+
+# Function to read a fund's full history as sorted, de-duplicated column arrays
+# Function to make sure a fund is in the store, importing its legacy JSON file
+# if allowed. Reads themselves need no lock: the date column is read first and
+# written last, and generation switches are detected by _read_generation.
+def _ensure_imported(symbol):
+    if has_fund(symbol):
+        return True
+    if not AUTO_IMPORT_LEGACY:
+        return False
+    with symbol_lock(symbol):
+        return has_fund(symbol) or bool(import_legacy_json(symbol))
+
+
+def read_columns(symbol):
+    if not _ensure_imported(symbol):
+        return None
+    return sort_and_dedup(_read_raw_columns(symbol))
+
+
+# Function to read only the (unsorted) date column of a fund
+def read_dates(symbol):
+    if not _ensure_imported(symbol):
+        return None
+    return _read_generation(symbol, ['date'])['date']
+
+
+# Function to rewrite a fund's columns sorted and without duplicate dates
+def compact(symbol):
+    with symbol_lock(symbol):
+        if not has_fund(symbol) and not import_legacy_json(symbol):
+            return None
+
+        raw = _read_raw_columns(symbol)
+        columns = sort_and_dedup(raw)
+        if len(columns['date']) == len(raw['date']) and np.array_equal(columns['date'], raw['date']):
+            return columns
+
+        write_columns(symbol, columns)
+    return columns
+
+
+# Function to replace a fund's columns with the given (sorted, de-duplicated) arrays
+def write_columns(symbol, columns):
+    with symbol_lock(symbol):
+        current = _generation(symbol)
+        generation = (current or 0) + 1
+        directory = _generation_dir(symbol, generation)
+        # Left over from a rewrite that crashed before switching
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        for column, (_, dtype) in COLUMNS.items():
+            columns[column].astype(dtype).tofile(_column_path(directory, column))
+
+        # Switch generations in one atomic step
+        tmp_path = f"{_manifest_path(symbol)}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'generation': generation}, f)
+        os.replace(tmp_path, _manifest_path(symbol))
+        _remove_old_generations(symbol, generation)
+
+
+# Function to delete the generations a rewrite replaced. Readers still on one
+# notice the switch through the manifest and read again.
+def _remove_old_generations(symbol, generation):
+    for entry in os.listdir(fund_dir(symbol)):
+        path = os.path.join(fund_dir(symbol), entry)
+        if _GENERATION_DIR.match(entry) and entry != f"g{generation}":
+            shutil.rmtree(path, ignore_errors=True)
+        elif entry.endswith('.bin') or entry.endswith('.bin.tmp'):
+            # Columns of the layout without a manifest
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+_columns_cache = {}
+
+
+def data_version(symbol):
+    try:
+        stat = os.stat(_column_path(_generation_dir(symbol, _generation(symbol)), 'date'))
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Function to identify the current contents of a fund: the version of its store
+# files, or of its legacy JSON file if it has not been imported yet
+def source_version(symbol):
+    version = data_version(symbol)
+    if version is not None:
+        return version
+    try:
+        stat = os.stat(os.path.join(LEGACY_DIR, f"{symbol}.json"))
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Function to read a fund's columns through an in-process cache that is
+# invalidated whenever the fund's files change. The arrays are shared between
+# callers and therefore read-only.
+def cached_columns(symbol):
+    version = data_version(symbol)
+    cached = _columns_cache.get(symbol)
+    if version is not None and cached is not None and cached[0] == version:
+        return cached[1]
+
+    columns = read_columns(symbol)
+    if columns is None:
+        return None
+    for values in columns.values():
+        values.setflags(write=False)
+    # Keep the version seen before reading, so a write during the read invalidates the entry
+    if version is None:
+        version = data_version(symbol)
+    _columns_cache[symbol] = (version, columns)
+    return columns
+
+
+# Function to list every fund available in the store or as a legacy JSON file
+def list_symbols():
+    symbols = set()
+    if os.path.isdir(STORE_DIR):
+        symbols.update(entry for entry in os.listdir(STORE_DIR) if has_fund(entry))
+    if os.path.isdir(LEGACY_DIR):
+        symbols.update(filename[:-5] for filename in os.listdir(LEGACY_DIR) if filename.endswith('.json'))
+    return sorted(symbols)
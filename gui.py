@@ -1,10 +1,18 @@
 from PyQt5 import QtWidgets, QtGui, QtCore
-import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import json
+from matplotlib.figure import Figure
+import multiprocessing
 import os
-from datetime import datetime, timedelta
+import threading
+from datetime import date, datetime, timedelta
+import numpy as np
 from main import get_all_fund_list, get_all_historical_data
+import fund_store
+from valuation import value_portfolio
+import portfolio_store
+import chart_overlays
+import risk_engine
+from live_prices import DEFAULT_POLL_INTERVAL_MS, PricePoller
 
 class NumericTableWidgetItem(QtWidgets.QTableWidgetItem):
     def __init__(self, text):
@@ -20,6 +28,10 @@ class NumericTableWidgetItem(QtWidgets.QTableWidgetItem):
             return self.text() < other.text()
 
 class FundDataVisualization(QtWidgets.QWidget):
+    # Internal: emitted from the risk simulation thread with its report, or the error message
+    _risk_simulated = QtCore.pyqtSignal(object)
+    _risk_failed = QtCore.pyqtSignal(str)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Fund Data Visualization")
@@ -69,6 +81,11 @@ class FundDataVisualization(QtWidgets.QWidget):
         chart_layout = QtWidgets.QVBoxLayout(self.chart_frame)
         viz_layout.addWidget(self.chart_frame)
 
+        # One figure and canvas reused by every redraw
+        self.chart_figure = Figure(figsize=(10, 6))
+        self.chart_canvas = FigureCanvas(self.chart_figure)
+        chart_layout.addWidget(self.chart_canvas)
+
         # Add time filter buttons
         self.time_filter_layout = QtWidgets.QHBoxLayout()
         self.last_week_button = QtWidgets.QPushButton("Last Week")
@@ -137,12 +154,37 @@ class FundDataVisualization(QtWidgets.QWidget):
 
         viz_layout.addWidget(control_frame)
 
+        # Overlay controls: indicators, funds to compare and a benchmark
+        overlay_frame = QtWidgets.QFrame()
+        overlay_layout = QtWidgets.QHBoxLayout(overlay_frame)
+        self.sma_20_checkbox = QtWidgets.QCheckBox("SMA 20")
+        self.sma_50_checkbox = QtWidgets.QCheckBox("SMA 50")
+        self.bollinger_checkbox = QtWidgets.QCheckBox("Bollinger (20, 2)")
+        self.rsi_checkbox = QtWidgets.QCheckBox("RSI 14")
+        self.compare_input = QtWidgets.QLineEdit()
+        self.compare_input.setPlaceholderText("Compare with (e.g. GUH, GGK)")
+        self.benchmark_dropdown = QtWidgets.QComboBox()
+        self.benchmark_dropdown.addItem("No Benchmark", None)
+        for symbol, name in self.fund_data.items():
+            self.benchmark_dropdown.addItem(f"Benchmark: {symbol} - {name}", symbol)
+
+        for checkbox in (self.sma_20_checkbox, self.sma_50_checkbox, self.bollinger_checkbox, self.rsi_checkbox):
+            overlay_layout.addWidget(checkbox)
+            checkbox.toggled.connect(self.redraw_chart)
+        overlay_layout.addWidget(self.compare_input)
+        overlay_layout.addWidget(self.benchmark_dropdown)
+        self.compare_input.editingFinished.connect(self.redraw_chart)
+        self.benchmark_dropdown.currentIndexChanged.connect(self.redraw_chart)
+
+        viz_layout.addWidget(overlay_frame)
+
         # Add a new frame for transaction details and buttons
         self.transaction_frame = QtWidgets.QFrame()
         transaction_layout = QtWidgets.QVBoxLayout(self.transaction_frame)
         viz_layout.addWidget(self.transaction_frame)
 
         # Initial Chart Update
+        self.chart_start = None
         self.update_chart()
 
         # Connect buttons to functions
@@ -156,14 +198,11 @@ class FundDataVisualization(QtWidgets.QWidget):
         self.all_data_button.clicked.connect(lambda: self.update_chart_with_filter('all'))
 
     def load_portfolio_data(self):
-        portfolio_file = './portfolios/my_portfolio_1.json'
         try:
-            with open(portfolio_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            # Create an empty portfolio file with the correct structure
-            with open(portfolio_file, 'w', encoding='utf-8') as f:
-                json.dump([], f)
+            return portfolio_store.read_portfolio(1)
+        except portfolio_store.PortfolioError as e:
+            # Leave a damaged file alone so it can be repaired by hand
+            QtWidgets.QMessageBox.warning(self, "Error", f"Unable to read the portfolio: {e}")
             return []
 
     def setup_portfolio_tab(self):
@@ -220,6 +259,29 @@ class FundDataVisualization(QtWidgets.QWidget):
         # Add the summary layout to the main layout
         layout.addLayout(summary_layout)
 
+        # Equity curve of the whole portfolio with its drawdown below
+        performance_layout = QtWidgets.QHBoxLayout()
+        self.twr_label = QtWidgets.QLabel("Time-Weighted Return: N/A")
+        performance_layout.addWidget(self.twr_label)
+        self.mwr_label = QtWidgets.QLabel("Money-Weighted Return (annual): N/A")
+        performance_layout.addWidget(self.mwr_label)
+        self.max_drawdown_label = QtWidgets.QLabel("Max Drawdown: N/A")
+        performance_layout.addWidget(self.max_drawdown_label)
+
+        # Forward-looking risk of the current holdings (simulated on request)
+        self.risk_label = QtWidgets.QLabel("1M VaR/CVaR (95%): N/A")
+        performance_layout.addWidget(self.risk_label)
+        self.risk_button = QtWidgets.QPushButton("Simulate Risk")
+        self.risk_button.clicked.connect(self.update_risk_estimate)
+        self._risk_simulated.connect(self.on_risk_simulated)
+        self._risk_failed.connect(self.on_risk_failed)
+        performance_layout.addWidget(self.risk_button)
+        layout.addLayout(performance_layout)
+
+        self.equity_figure = Figure(figsize=(10, 3))
+        self.equity_canvas = FigureCanvas(self.equity_figure)
+        layout.addWidget(self.equity_canvas)
+
         # Update My Funds table
         self.update_my_funds_table()
 
@@ -240,12 +302,33 @@ class FundDataVisualization(QtWidgets.QWidget):
         button_layout.addWidget(self.buy_button)
         button_layout.addWidget(self.sell_button)
         button_layout.addWidget(self.update_funds_button)
+
+        # Live price polling for the held funds
+        self.live_prices_checkbox = QtWidgets.QCheckBox("Live Prices")
+        button_layout.addWidget(self.live_prices_checkbox)
+        self.live_interval_input = QtWidgets.QSpinBox()
+        self.live_interval_input.setRange(1, 240)
+        self.live_interval_input.setValue(DEFAULT_POLL_INTERVAL_MS // 60000)
+        self.live_interval_input.setSuffix(" min")
+        button_layout.addWidget(self.live_interval_input)
         layout.addLayout(button_layout)
 
+        self.price_poller = PricePoller(self.held_symbols, parent=self)
+        self.price_poller.symbolsChanged.connect(self.refresh_fund_rows)
+
         # Connect buttons to functions
         self.buy_button.clicked.connect(self.show_buy_dialog)
         self.sell_button.clicked.connect(self.show_sell_dialog)
         self.update_funds_button.clicked.connect(self.update_my_funds_table)
+        self.live_prices_checkbox.toggled.connect(self.toggle_live_prices)
+        self.live_interval_input.valueChanged.connect(lambda minutes: self.price_poller.set_interval(minutes * 60000))
+
+    def toggle_live_prices(self, enabled):
+        if enabled:
+            self.price_poller.set_interval(self.live_interval_input.value() * 60000)
+            self.price_poller.start()
+        else:
+            self.price_poller.stop()
 
     def adjust_column_widths(self):
         total_width = self.my_funds_table.viewport().width()
@@ -260,14 +343,9 @@ class FundDataVisualization(QtWidgets.QWidget):
         self.portfolio_data = self.load_portfolio_data()
 
         self.my_funds_table.setRowCount(0)  # Clear the table
+        self.my_funds_table.setSortingEnabled(False)
         fund_status = {}
-        total_cost_all_funds = 0.0
-        total_change_money = 0.0
-        total_initial_value = 0.0
-        change_percentages = []  # List to store change percentages
-        total_weighted_days = 0
-        total_quantity = 0
-        total_value_all_funds = 0.0  # Initialize total value
+        self.fund_stats = {}
 
         for entry in self.portfolio_data:
             try:
@@ -290,41 +368,76 @@ class FundDataVisualization(QtWidgets.QWidget):
                 continue
 
         for symbol, quantity in fund_status.items():
-            full_name = self.fund_data.get(symbol, "Unknown Fund")
-            change_percentage, change_money, avg_holding_days, total_cost = self.calculate_current_change(symbol, quantity)
-            
-            # Calculate the total value
-            latest_price = self.get_latest_price(symbol)
-            total_value = latest_price * quantity
+            self.fund_stats[symbol] = self.calculate_fund_stats(symbol, quantity)
+
+            row_position = self.my_funds_table.rowCount()
+            self.my_funds_table.insertRow(row_position)
+            self.set_fund_row(row_position, symbol)
 
-            # Accumulate total cost and total change in money
-            total_cost_all_funds += total_cost
-            total_change_money += change_money
+        self.my_funds_table.setSortingEnabled(True)
+        self.update_portfolio_summary()
 
-            # Accumulate initial total value
-            total_initial_value += total_cost
+    def held_symbols(self):
+        return list(getattr(self, 'fund_stats', {}).keys())
 
-            # Store change percentage for color calculation
-            change_percentages.append(change_percentage)
+    def calculate_fund_stats(self, symbol, quantity):
+        change_percentage, change_money, avg_holding_days, total_cost = self.calculate_current_change(symbol, quantity)
+        
+        # Calculate the total value
+        latest_price = self.get_latest_price(symbol)
+
+        return {
+            'quantity': quantity,
+            'total_value': latest_price * quantity,
+            'total_cost': total_cost,
+            'change_percentage': change_percentage,
+            'change_money': change_money,
+            'avg_holding_days': avg_holding_days,
+        }
 
-            # Accumulate weighted days and quantity for average holding days calculation
-            total_weighted_days += avg_holding_days * quantity
-            total_quantity += quantity
+    def set_fund_row(self, row_position, symbol):
+        stats = self.fund_stats[symbol]
+        full_name = self.fund_data.get(symbol, "Unknown Fund")
+        change_per_day = stats['change_percentage'] / stats['avg_holding_days'] if stats['avg_holding_days'] else 0.0
+
+        self.my_funds_table.setItem(row_position, 0, QtWidgets.QTableWidgetItem(symbol))
+        self.my_funds_table.setItem(row_position, 1, QtWidgets.QTableWidgetItem(full_name))
+        self.my_funds_table.setItem(row_position, 2, NumericTableWidgetItem(str(stats['quantity'])))  # Quantity
+        self.my_funds_table.setItem(row_position, 3, NumericTableWidgetItem(f"₺{stats['total_value']:.2f}"))  # Total Value
+        self.my_funds_table.setItem(row_position, 4, NumericTableWidgetItem(f"₺{stats['total_cost']:.2f}"))  # Total Cost
+        self.my_funds_table.setItem(row_position, 5, NumericTableWidgetItem(f"{stats['change_percentage']:.2f}%"))  # Change (%)
+        self.my_funds_table.setItem(row_position, 6, NumericTableWidgetItem(f"₺{stats['change_money']:.2f}"))  # Change (₺)
+        self.my_funds_table.setItem(row_position, 7, NumericTableWidgetItem(f"{change_per_day:.2f}"))  # C%/AHD
+        self.my_funds_table.setItem(row_position, 8, NumericTableWidgetItem(f"{stats['avg_holding_days']:.1f}"))  # AHD
+
+    def refresh_fund_rows(self, symbols):
+        # Recompute only the rows of the given symbols, then the summary
+        symbols = [symbol for symbol in symbols if symbol in self.fund_stats]
+        if not symbols:
+            return
 
-            # Accumulate total value
-            total_value_all_funds += total_value
+        self.my_funds_table.setSortingEnabled(False)
+        for row in range(self.my_funds_table.rowCount()):
+            symbol_item = self.my_funds_table.item(row, 0)
+            if symbol_item is not None and symbol_item.text() in symbols:
+                symbol = symbol_item.text()
+                self.fund_stats[symbol] = self.calculate_fund_stats(symbol, self.fund_stats[symbol]['quantity'])
+                self.set_fund_row(row, symbol)
+        self.my_funds_table.setSortingEnabled(True)
 
-            row_position = self.my_funds_table.rowCount()
-            self.my_funds_table.insertRow(row_position)
-            self.my_funds_table.setItem(row_position, 0, QtWidgets.QTableWidgetItem(symbol))
-            self.my_funds_table.setItem(row_position, 1, QtWidgets.QTableWidgetItem(full_name))
-            self.my_funds_table.setItem(row_position, 2, NumericTableWidgetItem(str(quantity)))  # Quantity
-            self.my_funds_table.setItem(row_position, 3, NumericTableWidgetItem(f"₺{total_value:.2f}"))  # Total Value
-            self.my_funds_table.setItem(row_position, 4, NumericTableWidgetItem(f"₺{total_cost:.2f}"))  # Total Cost
-            self.my_funds_table.setItem(row_position, 5, NumericTableWidgetItem(f"{change_percentage:.2f}%"))  # Change (%)
-            self.my_funds_table.setItem(row_position, 6, NumericTableWidgetItem(f"₺{change_money:.2f}"))  # Change (₺)
-            self.my_funds_table.setItem(row_position, 7, NumericTableWidgetItem(f"{change_percentage / avg_holding_days:.2f}"))  # C%/AHD
-            self.my_funds_table.setItem(row_position, 8, NumericTableWidgetItem(f"{avg_holding_days:.1f}"))  # AHD
+        # The equity curve is a daily history; it is redrawn on "Update My Funds", not on every price tick
+        self.update_portfolio_summary(redraw_equity=False)
+
+    def update_portfolio_summary(self, redraw_equity=True):
+        # Totals are aggregated from the per-fund stats, no data is reloaded here
+        stats = list(self.fund_stats.values())
+        total_cost_all_funds = sum(fund['total_cost'] for fund in stats)
+        total_change_money = sum(fund['change_money'] for fund in stats)
+        total_initial_value = total_cost_all_funds
+        total_value_all_funds = sum(fund['total_value'] for fund in stats)
+        total_weighted_days = sum(fund['avg_holding_days'] * fund['quantity'] for fund in stats)
+        total_quantity = sum(fund['quantity'] for fund in stats)
+        change_percentages = [fund['change_percentage'] for fund in stats]  # List to store change percentages
 
         # Calculate min and max change percentages for color scaling
         min_change = min(change_percentages) if change_percentages else 0
@@ -364,34 +477,86 @@ class FundDataVisualization(QtWidgets.QWidget):
         total_change_per_ahd = total_change_percentage / average_holding_days if average_holding_days > 0 else 0
         self.total_change_per_ahd_label.setText(f"Total Change (%)/AHD: {total_change_per_ahd:.2f}")
 
-        
+        # Redraw the equity curve
+        if redraw_equity:
+            self.update_equity_curve()
 
-    def get_latest_price(self, symbol):
+    def update_equity_curve(self):
+        result = value_portfolio(self.portfolio_data)
+        self.equity_figure.clear()
+
+        if result is None:
+            self.twr_label.setText("Time-Weighted Return: N/A")
+            self.mwr_label.setText("Money-Weighted Return (annual): N/A")
+            self.max_drawdown_label.setText("Max Drawdown: N/A")
+            self.equity_canvas.draw_idle()
+            return
+
+        dates = [datetime.fromordinal(int(ordinal)) for ordinal in result['dates']]
+        twr = result['time_weighted_return'] * 100
+        mwr = result['money_weighted_return']
+        max_drawdown = result['drawdown'].min() * 100
+
+        self.twr_label.setText(f"Time-Weighted Return: {twr:.2f}%")
+        self.mwr_label.setText(f"Money-Weighted Return (annual): {mwr * 100:.2f}%" if mwr is not None else "Money-Weighted Return (annual): N/A")
+        self.max_drawdown_label.setText(f"Max Drawdown: {max_drawdown:.2f}%")
+
+        equity_ax, drawdown_ax = self.equity_figure.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios': [3, 1]})
+        equity_ax.plot(dates, result['equity'], label='Portfolio Value', linewidth=1.5)
+        equity_ax.set_ylabel("Value (₺)", fontsize=9)
+        equity_ax.legend(fontsize=9)
+        equity_ax.grid(True, linestyle='--', alpha=0.7)
+        drawdown_ax.fill_between(dates, result['drawdown'] * 100, 0, color='red', alpha=0.3)
+        drawdown_ax.set_ylabel("Drawdown (%)", fontsize=9)
+        drawdown_ax.grid(True, linestyle='--', alpha=0.7)
+        self.equity_figure.autofmt_xdate()
+        self.equity_figure.tight_layout()
+        self.equity_canvas.draw_idle()
+
+
+    def update_risk_estimate(self):
+        # The simulation loads the price panel and runs a process pool, keep it off the GUI thread
+        self.risk_button.setEnabled(False)
+        self.risk_label.setText("1M VaR/CVaR (95%): simulating...")
+        threading.Thread(target=self._simulate_risk, daemon=True).start()
+
+    def _simulate_risk(self):
         try:
-            with open(f'funds/{symbol}.json', 'r', encoding='utf-8') as f:
-                historical_data = json.load(f)
-            if not historical_data:
-                return 0.0
-            # Sort data by date to find the latest price
-            historical_data.sort(key=lambda x: datetime.strptime(x['Date'], '%Y-%m-%d'))
-            return float(historical_data[-1]['Price'])
-        except (FileNotFoundError, json.JSONDecodeError):
+            # Forking from this thread would copy the GUI's other threads' locks into the workers
+            report = risk_engine.simulate_portfolio(1, horizon=21, mp_context=multiprocessing.get_context('spawn'))
+            self._risk_simulated.emit(report)
+        except Exception as e:  # a slot must not raise, report any failure in the GUI instead
+            self._risk_failed.emit(str(e))
+
+    def on_risk_failed(self, message):
+        self.risk_button.setEnabled(True)
+        self.risk_label.setText("1M VaR/CVaR (95%): N/A")
+        QtWidgets.QMessageBox.warning(self, "Error", f"Unable to simulate the portfolio risk: {message}")
+
+    def on_risk_simulated(self, report):
+        self.risk_button.setEnabled(True)
+        if report is None:
+            self.risk_label.setText("1M VaR/CVaR (95%): N/A")
+            return
+        self.risk_label.setText(f"1M VaR/CVaR (95%): {report['var_95%']:,.2f} / {report['cvar_95%']:,.2f} ₺ "
+                                f"(loss probability {report['probability_of_loss']:.0%})")
+
+    def get_latest_price(self, symbol):
+        columns = fund_store.cached_columns(symbol)
+        if columns is None or len(columns['price']) == 0:
             return 0.0
+        return float(columns['price'][-1])
 
     def calculate_current_change(self, symbol, quantity):
-        # Load historical data for the symbol
-        try:
-            with open(f'funds/{symbol}.json', 'r', encoding='utf-8') as f:
-                historical_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return 0.0, 0.0, 0, 0.0  # Return 0 for average holding days and total cost
+        # Price arrays come from the store's cache, so live updates only re-read changed funds
+        columns = fund_store.cached_columns(symbol)
 
-        if not historical_data:
+        if columns is None or len(columns['date']) == 0:
             return 0.0, 0.0, 0, 0.0
 
-        # Sort data by date to find the latest price
-        historical_data.sort(key=lambda x: datetime.strptime(x['Date'], '%Y-%m-%d'))
-        latest_price = float(historical_data[-1]['Price'])
+        dates, prices = columns['date'], columns['price']
+        latest_price = float(prices[-1])
+        today = date.today()
 
         # Calculate the weighted average holding period and total cost
         total_weighted_days = 0
@@ -401,18 +566,17 @@ class FundDataVisualization(QtWidgets.QWidget):
 
         for entry in self.portfolio_data:
             if entry['symbol'] == symbol and entry['type'] == 'buy':
-                buying_date = datetime.strptime(entry['date'], '%Y-%m-%d')
-                days_held = (datetime.now() - buying_date).days
+                buying_date = date.fromisoformat(entry['date'])
+                days_held = (today - buying_date).days
                 total_weighted_days += entry['quantity'] * days_held
                 total_quantity += entry['quantity']
 
-                # Find the buying price for cost calculation
-                for data in historical_data:
-                    if datetime.strptime(data['Date'], '%Y-%m-%d') >= buying_date:
-                        buying_price = float(data['Price'])
-                        total_cost += entry['quantity'] * buying_price
-                        total_buying_price += entry['quantity'] * buying_price
-                        break
+                # Find the buying price (first trading day on or after the buy) for cost calculation
+                index = int(np.searchsorted(dates, buying_date.toordinal()))
+                if index < len(dates):
+                    buying_price = float(prices[index])
+                    total_cost += entry['quantity'] * buying_price
+                    total_buying_price += entry['quantity'] * buying_price
 
         average_holding_days = total_weighted_days / total_quantity if total_quantity > 0 else 0
         average_buying_price = total_buying_price / total_quantity if total_quantity > 0 else 0
@@ -426,29 +590,25 @@ class FundDataVisualization(QtWidgets.QWidget):
 
         return change_percentage, change_money, average_holding_days, total_cost
 
-    def update_chart(self, historical_data=None):
+    def update_chart(self, start_ordinal=None):
         # Ensure selected_fund is defined
         selected_fund = self.fund_dropdown.currentData()
         if not selected_fund:
             selected_fund = self.fund_dropdown.currentText().split(' - ')[0]
 
-        if historical_data is None:
-            try:
-                with open(f'funds/{selected_fund}.json', 'r', encoding='utf-8') as f:
-                    historical_data = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError) as e:
-                print(f"Error loading data for {selected_fund}: {e}")
-                return
-
-        if not historical_data:
+        columns = fund_store.cached_columns(selected_fund)
+        if columns is None or len(columns['date']) == 0:
             print(f"No data available for the selected fund")
             return
 
-        # Sort data by date to ensure correct order
-        historical_data.sort(key=lambda x: datetime.strptime(x['Date'], '%Y-%m-%d'))
-
-        dates = [datetime.strptime(item['Date'], '%Y-%m-%d') for item in historical_data]
-        prices = [float(item['Price']) for item in historical_data]
+        # Chart from start_ordinal on, or everything when the range holds no data
+        first = int(np.searchsorted(columns['date'], start_ordinal)) if start_ordinal else 0
+        if first == len(columns['date']):
+            print(f"Not enough data for the selected period, showing all available data.")
+            first = 0
+        ordinals = columns['date'][first:]
+        prices = columns['price'][first:]
+        dates = chart_overlays.to_datetime64(ordinals)
 
         # Calculate percentage change
         if len(prices) > 1:
@@ -461,41 +621,87 @@ class FundDataVisualization(QtWidgets.QWidget):
         else:
             percentage_change = 0.0
 
-        # Extract buy and sell dates
-        buy_dates = [datetime.strptime(entry['date'], '%Y-%m-%d') for entry in self.portfolio_data if entry['symbol'] == selected_fund and entry['type'] == 'buy']
-        sell_dates = [datetime.strptime(entry['date'], '%Y-%m-%d') for entry in self.portfolio_data if entry['symbol'] == selected_fund and entry['type'] == 'sell']
+        # Rows of the trading days the buys and sells were executed on, inside the charted range
+        buy_rows = self.snap_to_trading_days([entry['date'] for entry in self.portfolio_data if entry['symbol'] == selected_fund and entry['type'] == 'buy'], ordinals)
+        sell_rows = self.snap_to_trading_days([entry['date'] for entry in self.portfolio_data if entry['symbol'] == selected_fund and entry['type'] == 'sell'], ordinals)
+
+        # Overlays are memoized per fund, indicator and range, so redrawing with
+        # the same data only plots what was computed before
+        self.chart_start = start_ordinal
+        start_ordinal, end_ordinal = int(ordinals[0]), int(ordinals[-1])
+        compare_symbols = self.comparison_symbols(selected_fund)
+
+        rows = 1 + bool(compare_symbols) + self.rsi_checkbox.isChecked()
+        fig = self.chart_figure
+        fig.clear()
+        axes = fig.subplots(rows, 1, sharex=True, squeeze=False, gridspec_kw={'height_ratios': [3] + [1.5] * (rows - 1)})
+        axes = list(axes[:, 0])
+        ax = axes.pop(0)
+        ax.plot(dates, prices, label=f'Price (Change: {percentage_change:.2f}%)', linewidth=2)
 
-        # Filter buy and sell dates to only include those present in the historical data
-        buy_dates = [date for date in buy_dates if date in dates]
-        sell_dates = [date for date in sell_dates if date in dates]
+        for checkbox, window in ((self.sma_20_checkbox, 20), (self.sma_50_checkbox, 50)):
+            if checkbox.isChecked():
+                overlay_dates, values = chart_overlays.overlay(selected_fund, 'sma', (window,), start_ordinal, end_ordinal)
+                ax.plot(chart_overlays.to_datetime64(overlay_dates), values, label=f'SMA {window}', linewidth=1)
 
-        plt.clf()
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.plot(dates, prices, label=f'Price (Change: {percentage_change:.2f}%)', linewidth=2)
+        if self.bollinger_checkbox.isChecked():
+            overlay_dates, (middle, upper, lower) = chart_overlays.overlay(selected_fund, 'bollinger', (20, 2), start_ordinal, end_ordinal)
+            overlay_dates = chart_overlays.to_datetime64(overlay_dates)
+            ax.plot(overlay_dates, middle, color='gray', linewidth=1, linestyle='--', label='Bollinger (20, 2)')
+            ax.fill_between(overlay_dates, lower, upper, color='gray', alpha=0.15)
 
         # Plot buy and sell markers
-        ax.scatter(buy_dates, [prices[dates.index(date)] for date in buy_dates], color='green', marker='^', label='Buy')
-        ax.scatter(sell_dates, [prices[dates.index(date)] for date in sell_dates], color='red', marker='v', label='Sell')
+        ax.scatter(dates[buy_rows], prices[buy_rows], color='green', marker='^', label='Buy')
+        ax.scatter(dates[sell_rows], prices[sell_rows], color='red', marker='v', label='Sell')
+
+        if compare_symbols:
+            compare_ax = axes.pop(0)
+            benchmark = self.benchmark_dropdown.currentData()
+            for symbol, (overlay_dates, values) in chart_overlays.comparison([selected_fund] + compare_symbols, start_ordinal, end_ordinal).items():
+                linestyle = '--' if symbol == benchmark else '-'
+                compare_ax.plot(chart_overlays.to_datetime64(overlay_dates), values, linestyle=linestyle, linewidth=1, label=symbol)
+            compare_ax.set_ylabel("Normalized (start = 100)", fontsize=10)
+            compare_ax.legend(fontsize=8)
+            compare_ax.grid(True, linestyle='--', alpha=0.7)
+
+        if self.rsi_checkbox.isChecked():
+            rsi_ax = axes.pop(0)
+            overlay_dates, values = chart_overlays.overlay(selected_fund, 'rsi', (14,), start_ordinal, end_ordinal)
+            rsi_ax.plot(chart_overlays.to_datetime64(overlay_dates), values, color='purple', linewidth=1)
+            rsi_ax.axhline(70, color='red', linestyle='--', linewidth=0.8)
+            rsi_ax.axhline(30, color='green', linestyle='--', linewidth=0.8)
+            rsi_ax.set_ylim(0, 100)
+            rsi_ax.set_ylabel("RSI 14", fontsize=10)
+            rsi_ax.grid(True, linestyle='--', alpha=0.7)
 
         ax.set_title(f"Price History", fontsize=12, pad=10)
-        ax.set_xlabel("Date", fontsize=10)
+        fig.axes[-1].set_xlabel("Date", fontsize=10)
         ax.set_ylabel("Price", fontsize=10)
         ax.legend(fontsize=10)
         ax.grid(True, linestyle='--', alpha=0.7)
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-
-        for i in reversed(range(self.chart_frame.layout().count())):
-            widget = self.chart_frame.layout().itemAt(i).widget()
-            if widget is not None:
-                widget.setParent(None)
-
-        canvas = FigureCanvas(fig)
-        self.chart_frame.layout().addWidget(canvas)
-
-        # Ensure selected_fund is defined before calling update_transaction_details
-        if historical_data:
-            self.update_transaction_details(selected_fund)
+        fig.autofmt_xdate(rotation=45)
+        fig.tight_layout()
+        self.chart_canvas.draw_idle()
+
+        self.update_transaction_details(selected_fund)
+
+    def comparison_symbols(self, selected_fund):
+        symbols = [symbol.strip().upper() for symbol in self.compare_input.text().split(',') if symbol.strip()]
+        benchmark = self.benchmark_dropdown.currentData()
+        if benchmark:
+            symbols.append(benchmark)
+        return [symbol for symbol in dict.fromkeys(symbols) if symbol != selected_fund]
+
+    def redraw_chart(self):
+        # Redraw the charted range with the current overlays (the prices come from the store's cache)
+        self.update_chart(self.chart_start)
+
+    def snap_to_trading_days(self, transaction_dates, ordinals):
+        # A transaction is executed on the first trading day on or after its date;
+        # transactions before the charted range have no trading day in it
+        transaction_ordinals = np.array([date.fromisoformat(day).toordinal() for day in transaction_dates], dtype=np.int64)
+        rows = np.searchsorted(ordinals, transaction_ordinals)
+        return rows[(transaction_ordinals >= ordinals[0]) & (rows < len(ordinals))]
 
     def fetch_data_with_progress(self):
         # Implement the method to fetch historical data
@@ -557,52 +763,34 @@ class FundDataVisualization(QtWidgets.QWidget):
         date = date_picker.date().toString("yyyy-MM-dd")
         quantity = quantity_input.value()
 
-        # Check if selling more than available
-        if action == "Sell Fund":
-            fund_status = {}
-            for entry in self.portfolio_data:
-                act = entry['type']
-                qty = entry['quantity']
-                sym = entry['symbol']
-
-                if act == "buy":
-                    if sym in fund_status:
-                        fund_status[sym] += qty
-                    else:
-                        fund_status[sym] = qty
-                elif act == "sell":
-                    if sym in fund_status:
-                        fund_status[sym] -= qty
-                        if fund_status[sym] <= 0:
-                            del fund_status[sym]
-
-            if selected_fund not in fund_status or fund_status[selected_fund] < quantity:
-                QtWidgets.QMessageBox.warning(self, "Error", "Not enough funds to sell.")
-                return
-
-        # Create a new action
-        new_action = {
-            "portfolio_id": 1,  # Assuming this is for my_portfolio_1.json
-            "id": len(self.portfolio_data) + 1,
-            "symbol": selected_fund,
-            "date": date,
-            "type": "buy" if action == "Buy Fund" else "sell",
-            "quantity": quantity
-        }
+        log_line = f"{action} {quantity} of {selected_fund} on {date}"
+        try:
+            # Validate and append against the latest file, other instances may have changed it
+            with portfolio_store.transaction(1) as txn:
+                # Check if selling more than available
+                if action == "Sell Fund" and portfolio_store.holdings(txn.ledger).get(selected_fund, 0) < quantity:
+                    raise portfolio_store.PortfolioError("Not enough funds to sell.")
+
+                # Create a new action
+                new_action = {
+                    "portfolio_id": 1,  # Assuming this is for my_portfolio_1.json
+                    "id": txn.next_id(),
+                    "symbol": selected_fund,
+                    "date": date,
+                    "type": "buy" if action == "Buy Fund" else "sell",
+                    "quantity": quantity
+                }
+                txn.ledger.append(new_action)
+                txn.log(log_line)
+        except portfolio_store.PortfolioError as e:
+            QtWidgets.QMessageBox.warning(self, "Error", str(e))
+            return
 
         # Update portfolio data
-        self.portfolio_data.append(new_action)
-
-        # Save portfolio data to JSON file
-        with open('./portfolios/my_portfolio_1.json', 'w', encoding='utf-8') as f:
-            json.dump(self.portfolio_data, f, ensure_ascii=False, indent=4)
+        self.portfolio_data = txn.ledger
 
         # Update portfolio list
-        self.portfolio_list.addItem(f"{action} {quantity} of {selected_fund} on {date}")
-
-        # Log the action
-        with open("portfolio_log.txt", "a") as log_file:
-            log_file.write(f"{action} {quantity} of {selected_fund} on {date}\n")
+        self.portfolio_list.addItem(log_line)
 
         # Update My Funds table
         self.update_my_funds_table()  # Recalculate and update the table
@@ -666,21 +854,6 @@ class FundDataVisualization(QtWidgets.QWidget):
         return QtGui.QColor(red, green, blue)
 
     def update_chart_with_filter(self, period):
-        selected_fund = self.fund_dropdown.currentData()
-        if not selected_fund:
-            selected_fund = self.fund_dropdown.currentText().split(' - ')[0]
-
-        try:
-            with open(f'funds/{selected_fund}.json', 'r', encoding='utf-8') as f:
-                historical_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            print(f"Error loading data for {selected_fund}: {e}")
-            return
-
-        if not historical_data:
-            print(f"No data available for {selected_fund}")
-            return
-
         # Determine the date range
         end_date = datetime.now()
         if period == 'week':
@@ -700,17 +873,8 @@ class FundDataVisualization(QtWidgets.QWidget):
         else:
             start_date = None
 
-        # Filter data based on the date range
-        if start_date:
-            historical_data = [item for item in historical_data if datetime.strptime(item['Date'], '%Y-%m-%d') >= start_date]
-
-        # If no data is available for the specified range, show all available data
-        if not historical_data:
-            print(f"Not enough data for the selected period, showing all available data.")
-            historical_data = json.load(open(f'funds/{selected_fund}.json', 'r', encoding='utf-8'))
-
-        # Update the chart with the filtered data
-        self.update_chart(historical_data)
+        # Update the chart with the data from start_date on
+        self.update_chart(start_date.toordinal() if start_date else None)
 
     def on_header_clicked(self, logicalIndex):
         # Determine the current sort order for the column
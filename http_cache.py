@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import time
+from urllib.parse import urlencode
+
+import request_scheduler
+
+# Cache modes:
+#   'online' - serve fresh entries from disk, revalidate stale ones, fetch misses
+#   'replay' - serve everything from disk and never touch the network
+#   'off'    - bypass the cache entirely
+CACHE_MODE = os.environ.get('PORTFOLIO_HTTP_CACHE', 'online')
+CACHE_DIR = os.environ.get('PORTFOLIO_HTTP_CACHE_DIR', os.path.join('cache', 'http'))
+
+# Lifetime (in seconds) of responses whose content can still change
+DEFAULT_TTL = 6 * 60 * 60
+
+# Pass as ttl for responses that can never change (e.g. closed historical windows)
+KEEP_FOREVER = None
+
+CHUNK_SIZE = 64 * 1024
+
+# Response headers kept next to the cached body
+STORED_HEADERS = ('ETag', 'Last-Modified', 'Content-Type')
+
+
+class CachedResponse:
+    # Minimal stand-in for requests.Response backed by a file in the cache
+    def __init__(self, status_code, body_path=None, headers=None):
+        self.status_code = status_code
+        self.body_path = body_path
+        self.headers = headers or {}
+
+    @property
+    def content(self):
+        if self.body_path is None:
+            return b''
+        with open(self.body_path, 'rb') as f:
+            return f.read()
+
+    def json(self):
+        with open(self.body_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def iter_content(self, chunk_size=CHUNK_SIZE):
+        if self.body_path is None:
+            return
+        with open(self.body_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def close(self):
+        pass
+
+
+# Function to build the content address of a request (URL + form body)
+def cache_key(method, url, data=None):
+    body = urlencode(sorted(data.items())) if data else ''
+    return hashlib.sha256(f"{method.upper()} {url}\n{body}".encode('utf-8')).hexdigest()
+
+
+def _entry_paths(key):
+    entry_dir = os.path.join(CACHE_DIR, key[:2])
+    return os.path.join(entry_dir, f"{key}.body"), os.path.join(entry_dir, f"{key}.json")
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_meta(meta_path, meta):
+    tmp_path = f"{meta_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+
+
+def _is_fresh(meta, ttl):
+    # Entries recorded as immutable never expire. An entry recorded while its
+    # window was still open has to be fetched once more before it is kept forever.
+    if meta['ttl'] is None:
+        return True
+    if ttl is None:
+        return False
+    return time.time() - meta['fetched_at'] < ttl
+
+
+def _store(response, body_path, meta_path, method, url, data, ttl):
+    os.makedirs(os.path.dirname(body_path), exist_ok=True)
+
+    # Stream the body to disk so large responses are never held in memory
+    tmp_path = f"{body_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            f.write(chunk)
+    os.replace(tmp_path, body_path)
+
+    headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+    _write_meta(meta_path, {
+        'method': method,
+        'url': url,
+        'data': data,
+        'status_code': response.status_code,
+        'headers': headers,
+        'fetched_at': time.time(),
+        'ttl': ttl,
+    })
+    return headers
+
+
+# Function to perform a request through the on-disk response cache
+def fetch(method, url, data=None, ttl=DEFAULT_TTL):
+    method = method.upper()
+    if CACHE_MODE == 'off':
+        return request_scheduler.request(method, url, data=data, stream=True)
+
+    key = cache_key(method, url, data)
+    body_path, meta_path = _entry_paths(key)
+    meta = _read_meta(meta_path)
+    if meta is not None and not os.path.exists(body_path):
+        meta = None
+
+    if meta is not None and (CACHE_MODE == 'replay' or _is_fresh(meta, ttl)):
+        return CachedResponse(meta['status_code'], body_path, meta['headers'])
+
+    if CACHE_MODE == 'replay':
+        print(f"Cache miss in replay mode: {method} {url}")
+        return CachedResponse(504)
+
+    # Revalidate stale entries with the validators the server gave us
+    request_headers = {}
+    if meta is not None:
+        if 'ETag' in meta['headers']:
+            request_headers['If-None-Match'] = meta['headers']['ETag']
+        if 'Last-Modified' in meta['headers']:
+            request_headers['If-Modified-Since'] = meta['headers']['Last-Modified']
+
+    response = request_scheduler.request(method, url, data=data, headers=request_headers, stream=True)
+
+    if response.status_code == 304 and meta is not None:
+        response.close()
+        meta['fetched_at'] = time.time()
+        meta['ttl'] = ttl
+        _write_meta(meta_path, meta)
+        return CachedResponse(meta['status_code'], body_path, meta['headers'])
+
+    if response.status_code != 200:
+        return response
+
+    try:
+        headers = _store(response, body_path, meta_path, method, url, data, ttl)
+    finally:
+        response.close()
+    return CachedResponse(200, body_path, headers)
+
+
+def cached_get(url, ttl=DEFAULT_TTL):
+    return fetch('GET', url, ttl=ttl)
+
+
+def cached_post(url, data=None, ttl=DEFAULT_TTL):
+    return fetch('POST', url, data=data, ttl=ttl)
@@ -0,0 +1,63 @@
+import codecs
+import json
+import re
+
+# Incremental JSON reader for responses shaped like {..., "<key>": [item, item, ...], ...}.
+# Items are decoded one at a time from a stream of byte chunks, so only the
+# current chunk and the item being decoded are ever held in memory.
+
+_WHITESPACE = ' \t\r\n'
+
+
+def iter_array_items(chunks, key):
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    buffer = ''
+    pos = 0
+
+    def read_more():
+        for chunk in chunks:
+            text = text_decoder.decode(chunk)
+            if text:
+                return text
+        return None
+
+    # Find the opening bracket of the array, keeping only a short tail between chunks
+    while True:
+        match = array_start.search(buffer)
+        if match:
+            pos = match.end()
+            break
+        more = read_more()
+        if more is None:
+            raise ValueError(f"Key '{key}' not found in response")
+        buffer = buffer[-(len(key) + 16):] + more
+
+    while True:
+        # Skip separators between items
+        while pos < len(buffer) and (buffer[pos] in _WHITESPACE or buffer[pos] == ','):
+            pos += 1
+
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+
+        if pos < len(buffer):
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                # A number cut by a chunk boundary (12|3, 1.5|e3) decodes as a shorter
+                # number; only a following delimiter proves the item complete
+                if end < len(buffer) and (buffer[end] in _WHITESPACE or buffer[end] in ',]'):
+                    yield item
+                    pos = end
+                    continue
+            except json.JSONDecodeError:
+                pass
+
+        # The next item is incomplete, drop what was consumed and read on
+        more = read_more()
+        if more is None:
+            raise ValueError(f"Truncated array '{key}' in response")
+        buffer = buffer[pos:] + more
+        pos = 0
@@ -0,0 +1,125 @@
+import threading
+from datetime import date
+
+import numpy as np
+from PyQt5 import QtCore
+
+import fund_store
+from main import get_fund_info
+from trading_calendar import get_trading_calendar
+
+# Live price polling for the funds currently held. Every poll fetches the
+# FonAnaliz page of each held symbol in a background thread, merges prices
+# that differ from the store, and reports the symbols whose price changed.
+# Changes arriving close together are coalesced into a single event so the
+# GUI recomputes each affected row once.
+
+DEFAULT_POLL_INTERVAL_MS = 5 * 60 * 1000
+DEFAULT_COALESCE_MS = 500
+
+# FonAnaliz label -> store column
+FUND_INFO_FIELDS = {
+    'Son Fiyat (TL)': 'price',
+    'Pay (Adet)': 'shares',
+    'Yatırımcı Sayısı (Kişi)': 'investors',
+    'Fon Toplam Değer (TL)': 'portfolio_size',
+}
+
+
+# Function to merge one FonAnaliz snapshot into the store; returns True if the price changed
+def merge_fund_info(symbol, fund_info, day):
+    price = fund_info.get('Son Fiyat (TL)')
+    if price is None:
+        return False
+
+    # The page keeps showing the previous price until the new one is published,
+    # so a price equal to the last stored one is not news
+    columns = fund_store.cached_columns(symbol)
+    if columns is not None and len(columns['date']):
+        index = np.searchsorted(columns['date'], day.toordinal(), side='right') - 1
+        if index >= 0 and columns['price'][index] == price:
+            return False
+
+    batch = {'date': np.array([day.toordinal()])}
+    for label, column in FUND_INFO_FIELDS.items():
+        value = fund_info.get(label)
+        batch[column] = np.array([np.nan if value is None else value])
+    fund_store.append_batch(symbol, batch, name=fund_info.get('Fon İsmi'))
+    return True
+
+
+class PricePoller(QtCore.QObject):
+    # Emitted on the GUI thread with the sorted list of symbols whose price changed
+    symbolsChanged = QtCore.pyqtSignal(list)
+
+    # Internal: emitted from the polling thread for every symbol whose price changed
+    _polled = QtCore.pyqtSignal(list)
+
+    def __init__(self, held_symbols, interval_ms=DEFAULT_POLL_INTERVAL_MS, coalesce_ms=DEFAULT_COALESCE_MS, parent=None):
+        super().__init__(parent)
+        self.held_symbols = held_symbols
+        self.poll_thread = None
+        self.pending_symbols = set()
+
+        self.poll_timer = QtCore.QTimer(self)
+        self.poll_timer.setInterval(interval_ms)
+        self.poll_timer.timeout.connect(self.poll)
+
+        self.coalesce_timer = QtCore.QTimer(self)
+        self.coalesce_timer.setSingleShot(True)
+        self.coalesce_timer.setInterval(coalesce_ms)
+        self.coalesce_timer.timeout.connect(self.flush)
+
+        self._polled.connect(self.on_polled)
+
+    def set_interval(self, interval_ms):
+        self.poll_timer.setInterval(interval_ms)
+
+    def start(self):
+        self.poll_timer.start()
+        self.poll()
+
+    def stop(self):
+        self.poll_timer.stop()
+
+    def is_active(self):
+        return self.poll_timer.isActive()
+
+    def poll(self):
+        # Skip this tick if the previous poll is still running
+        if self.poll_thread is not None and self.poll_thread.is_alive():
+            return
+        symbols = sorted(set(self.held_symbols()))
+        if not symbols:
+            return
+        self.poll_thread = threading.Thread(target=self._poll_symbols, args=(symbols,), daemon=True)
+        self.poll_thread.start()
+
+    def _poll_symbols(self, symbols):
+        # Prices on FonAnaliz belong to the last trading day
+        day = get_trading_calendar().previous_trading_day(date.today()) or date.today()
+        for symbol in symbols:
+            try:
+                fund_info = get_fund_info(symbol, ttl=0)
+            except Exception as e:
+                print(f"Error polling {symbol}: {e}")
+                continue
+            if isinstance(fund_info, dict) and merge_fund_info(symbol, fund_info, day):
+                self._polled.emit([symbol])
+
+    def on_polled(self, changed):
+        if not changed:
+            return
+        self.pending_symbols.update(changed)
+        # Restarting the timer folds bursts of changes into one event
+        self.coalesce_timer.start()
+
+    def flush(self):
+        if self.pending_symbols:
+            symbols = sorted(self.pending_symbols)
+            self.pending_symbols.clear()
+            self.symbolsChanged.emit(symbols)
+
+    # Function for other sources (e.g. a finished fetch) to report changed symbols
+    def notify_changed(self, symbols):
+        self.on_polled(list(symbols))
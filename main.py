@@ -1,18 +1,67 @@
-import requests
 from bs4 import BeautifulSoup
 import json
 import warnings
 import csv
-from datetime import date, datetime, timedelta
+from datetime import date, timedelta
 import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from PyQt5 import QtWidgets, QtCore
+import numpy as np
+from http_cache import cached_get, cached_post, KEEP_FOREVER
+from json_stream import iter_array_items
+import fund_store
+import fetch_coverage
+import normalize
+import snapshot_archive
+import request_scheduler
+from trading_calendar import get_trading_calendar
 
 # Suppress the DeprecationWarning
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-def get_fund_info(symbol):
+# Cache lifetimes (in seconds) for scraped pages
+FUND_INFO_TTL = 60 * 60
+FUND_LIST_TTL = 24 * 60 * 60
+OPEN_WINDOW_TTL = 6 * 60 * 60
+
+# Historical windows ending at least this many days ago are treated as closed
+# (TEFAS can still publish late prices for the most recent days)
+CLOSED_WINDOW_LAG_DAYS = 7
+
+HISTORY_URL = "https://www.tefas.gov.tr/api/DB/BindHistoryInfo"
+
+# Funds fetched at the same time; the request scheduler limits the requests actually in flight
+FETCH_WORKERS = request_scheduler.MAX_CONCURRENCY
+
+# Rounds a failed window is re-queued within one run (with a growing delay in
+# seconds) before it is left to the next run
+WINDOW_RETRY_ROUNDS = 3
+WINDOW_RETRY_DELAY = 30
+
+# Seconds between progress dialog updates while fetching
+PROGRESS_INTERVAL = 0.2
+
+# Rows converted and written to the store at once while streaming a response
+INGEST_BATCH_SIZE = 1000
+
+# TARIH values are midnight Turkey time (UTC+3) in epoch milliseconds
+TEFAS_UTC_OFFSET_MS = 3 * 60 * 60 * 1000
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+# BindHistoryInfo field -> store column
+HISTORY_FIELDS = {
+    'FIYAT': 'price',
+    'TEDPAYSAYISI': 'shares',
+    'KISISAYISI': 'investors',
+    'PORTFOYBUYUKLUK': 'portfolio_size',
+    'BORSABULTENFIYAT': 'market_price',
+}
+
+def get_fund_info(symbol, ttl=FUND_INFO_TTL):
     url = f"https://www.tefas.gov.tr/FonAnaliz.aspx?FonKod={symbol}"
-    response = requests.get(url)
+    response = cached_get(url, ttl=ttl)
     
     if response.status_code != 200:
         return f"Error: Unable to fetch data for symbol {symbol}"
@@ -69,7 +118,9 @@ def get_fund_info(symbol):
                     value = span.text.strip()
                     fund_info[label] = value
     
-    return fund_info
+    # Type the values once here so no reader has to parse Turkish number formats
+    fund_info = normalize.normalize_fund_info(fund_info)
+    return normalize.validate_fund_info(fund_info) or fund_info
 
 def get_all_fund_list():
     base_url = "https://www.takasbank.com.tr/tr/kaynaklar/tefas-yatirim-fonlari"
@@ -78,7 +129,7 @@ def get_all_fund_list():
     
     while True:
         url = f"{base_url}?page={page}"
-        response = requests.get(url)
+        response = cached_get(url, ttl=FUND_LIST_TTL)
         
         if response.status_code != 200:
             print(f"Error: Unable to fetch data from page {page}")
@@ -128,74 +179,152 @@ def get_todays_data():
     # Get all funds
     all_funds = get_all_fund_list()
 
-    # Prepare data for CSV
-    csv_data = []
-    for symbol, name in all_funds.items():
-        fund_data = get_fund_info(symbol)
-        fund_data['Symbol'] = symbol
-        fund_data['Name'] = name
-        csv_data.append(fund_data)
-
     # Generate filename with today's date
     today = date.today().strftime("%Y-%m-%d")
     filename = f"fund_data_{today}.csv"
 
-    # Write data to CSV file
+    # Write each fund to the CSV file as soon as it is fetched
+    snapshots = {}
     with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-        if csv_data:
-            fieldnames = csv_data[0].keys()
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            writer.writeheader()
-            for row in csv_data:
-                writer.writerow(row)
+        writer = None
+        for symbol, name in all_funds.items():
+            fund_data = get_fund_info(symbol)
+            if not isinstance(fund_data, dict):
+                print(f"{symbol}: {fund_data}")
+                continue
+            snapshots[symbol] = dict(fund_data)
+            fund_data['Symbol'] = symbol
+            fund_data['Name'] = name
+
+            if writer is None:
+                writer = csv.DictWriter(csvfile, fieldnames=fund_data.keys())
+                writer.writeheader()
+            writer.writerow(fund_data)
+
+    # Keep today's snapshots in the columnar archive for queries over time
+    if snapshots:
+        snapshot_archive.write_snapshot(date.today(), snapshots)
 
     print(f"Data has been saved to {filename}")
 
-def get_fund_historical_data(symbol, start_date, end_date):
-    url = "https://www.tefas.gov.tr/api/DB/BindHistoryInfo"
-    
-    historical_data = []
-    
-    while start_date < end_date:
-        interval_end = min(start_date + timedelta(days=90), end_date)
-        
-        data = {
-            "fontip": "YAT",
-            "fonkod": symbol,
-            "bastarih": start_date.strftime("%d.%m.%Y"),
-            "bittarih": interval_end.strftime("%d.%m.%Y"),
-            "fonturkod": "",
-            "fonunvantip": ""
-        }
-        
-        response = requests.post(url, data=data)
-        
-        if response.status_code != 200:
-            print(f"Error: Unable to fetch historical data for symbol {symbol}")
-            return []
-        
-        json_data = response.json()
-        
-        if 'data' not in json_data:
-            print(f"Error: Unexpected response format for symbol {symbol}")
-            return []
-        
-        for item in json_data['data']:
-            historical_data.append({
-                'Date': datetime.fromtimestamp(int(item['TARIH']) / 1000).strftime('%Y-%m-%d'),
-                'Symbol': item['FONKODU'],
-                'Name': item['FONUNVAN'],
-                'Price': item['FIYAT'],
-                'Number_of_Shares': item['TEDPAYSAYISI'],
-                'Number_of_Investors': item['KISISAYISI'],
-                'Portfolio_Size': item['PORTFOYBUYUKLUK'],
-                'Stock_Market_Price': item['BORSABULTENFIYAT']
-            })
-        
-        start_date = interval_end + timedelta(days=1)
-    
-    return historical_data
+def post_history_window(symbol, start_date, end_date):
+    data = {
+        "fontip": "YAT",
+        "fonkod": symbol,
+        "bastarih": start_date.strftime("%d.%m.%Y"),
+        "bittarih": end_date.strftime("%d.%m.%Y"),
+        "fonturkod": "",
+        "fonunvantip": ""
+    }
+
+    # Windows that closed long enough ago can never change, keep them forever
+    if end_date <= date.today() - timedelta(days=CLOSED_WINDOW_LAG_DAYS):
+        ttl = KEEP_FOREVER
+    else:
+        ttl = OPEN_WINDOW_TTL
+    return cached_post(HISTORY_URL, data=data, ttl=ttl)
+
+def history_items_to_columns(items):
+    # Convert TARIH epoch milliseconds to date ordinals in one vectorized step
+    milliseconds = np.asarray([item['TARIH'] for item in items]).astype(np.int64)
+    columns = {'date': (milliseconds + TEFAS_UTC_OFFSET_MS) // MS_PER_DAY + fund_store.EPOCH_ORDINAL}
+    for field, column in HISTORY_FIELDS.items():
+        columns[column] = fund_store.to_float_array([item.get(field) for item in items])
+    return columns
+
+def append_history_batch(symbol, items):
+    columns = history_items_to_columns(items)
+    last_ordinal = int(columns['date'].max())
+    columns, dropped = normalize.normalize_history_columns(columns)
+    if dropped:
+        print(f"  {symbol}: dropped {dropped} invalid or duplicate row(s)")
+    written = fund_store.append_batch(symbol, columns, name=items[-1].get('FONUNVAN'))
+    return written, last_ordinal
+
+def ingest_history_window(symbol, start_date, end_date):
+    # Stream one window straight into the store in fixed-size batches.
+    # Returns (rows written, last date ordinal seen) or None on failure.
+    response = post_history_window(symbol, start_date, end_date)
+
+    if response.status_code != 200:
+        print(f"Error: Unable to fetch historical data for symbol {symbol} ({start_date} - {end_date})")
+        return None
+
+    rows_written = 0
+    last_ordinal = None
+    batch = []
+
+    try:
+        for item in iter_array_items(response.iter_content(), 'data'):
+            batch.append(item)
+            if len(batch) == INGEST_BATCH_SIZE:
+                written, batch_last = append_history_batch(symbol, batch)
+                rows_written += written
+                last_ordinal = max(batch_last, last_ordinal or batch_last)
+                batch = []
+    except ValueError:
+        print(f"Error: Unexpected response format for symbol {symbol} ({start_date} - {end_date})")
+        return None
+    finally:
+        response.close()
+
+    if batch:
+        written, batch_last = append_history_batch(symbol, batch)
+        rows_written += written
+        last_ordinal = max(batch_last, last_ordinal or batch_last)
+
+    return rows_written, last_ordinal
+
+def ingest_fund_history(symbol, windows, cancel=None):
+    # Fetch the given windows, recording each successful one in the coverage index.
+    # Failed (or cancelled) windows are returned and stay uncovered, so they can be
+    # re-queued and a later run still retries only those windows.
+    rows_written = 0
+    failed_windows = []
+    closed_before = date.today() - timedelta(days=CLOSED_WINDOW_LAG_DAYS)
+
+    for start_date, end_date in windows:
+        if cancel is not None and cancel.is_set():
+            failed_windows.append((start_date, end_date))
+            continue
+        try:
+            result = ingest_history_window(symbol, start_date, end_date)
+        except OSError as e:  # includes connection errors after the scheduler's retries
+            print(f"Error: Request for {symbol} ({start_date} - {end_date}) failed: {e}")
+            result = None
+        if result is None:
+            failed_windows.append((start_date, end_date))
+            continue
+
+        written, last_ordinal = result
+        rows_written += written
+
+        # Prices for the most recent days may still be published, so an open
+        # window only counts as covered up to the last date that came back
+        covered_end = closed_before
+        if last_ordinal is not None:
+            covered_end = max(covered_end, date.fromordinal(last_ordinal))
+        covered_end = min(covered_end, end_date)
+        if covered_end >= start_date:
+            fetch_coverage.mark_covered(symbol, start_date, covered_end)
+
+    return rows_written, failed_windows
+
+def report_fund_history(symbol, rows_written, failed_windows):
+    if failed_windows:
+        print(f"  {symbol}: {len(failed_windows)} window(s) failed and will be retried on the next run")
+
+    if rows_written:
+        columns = normalize.clean_fund(symbol)
+        first_date, last_date = fund_store.ordinals_to_iso(columns['date'][[0, -1]])
+
+        print(f"  {symbol}: data saved to {fund_store.fund_dir(symbol)}")
+        print(f"  Number of records: {len(columns['date'])}")
+        print(f"  Date range: {first_date} to {last_date}")
+    else:
+        print(f"  No new data available for {symbol}")
+
+    print()  # Empty line for readability
 
 def get_all_historical_data():
     all_funds = get_all_fund_list()
@@ -210,53 +339,71 @@ def get_all_historical_data():
     progress_dialog.setWindowModality(QtCore.Qt.WindowModal)
     progress_dialog.setMinimumDuration(0)
     
+    # Missing ranges without a single trading day are never fetched
+    calendar = get_trading_calendar(refresh=True)
+    
+    end_date = date.today()
+    start_date = end_date - timedelta(days=5*365)  # 5 years ago
+    
+    # Queue the missing windows of every fund; funds with complete history are done already
+    queue = []
+    completed = 0
     for index, (symbol, name) in enumerate(all_funds.items(), 1):
-        # Update progress dialog
-        progress_dialog.setValue(index)
-        progress_dialog.setLabelText(f"Processing fund {index}/{total_funds}: {symbol} - {name}")
-        
-        # Check if the user canceled the operation
-        if progress_dialog.wasCanceled():
-            break
-        
-        print(f"Processing fund {index}/{total_funds}: {symbol} - {name}")
-        
-        filename = f"funds/{symbol}.json"
-        end_date = date.today()
-        start_date = end_date - timedelta(days=5*365)  # 5 years ago
-        
-        if os.path.exists(filename):
-            with open(filename, 'r', encoding='utf-8') as f:
-                existing_data = json.load(f)
-            
-            if existing_data:
-                last_date = datetime.strptime(existing_data[0]['Date'], '%Y-%m-%d').date()
-                start_date = last_date + timedelta(days=1)
-                
-                print(f"  Existing data found. Updating from {start_date} to {end_date}")
-            else:
-                print(f"  Existing file is empty. Fetching all available data.")
-        else:
-            print(f"  No existing data. Fetching all available data.")
-        
-        new_data = get_fund_historical_data(symbol, start_date, end_date)
-        
-        if new_data:
-            if os.path.exists(filename):
-                new_data.extend(existing_data)
+        missing = fetch_coverage.missing_ranges(symbol, start_date, end_date, calendar)
+        if not missing:
+            completed += 1
+            continue
+        print(f"Queued fund {index}/{total_funds}: {symbol} - {name}")
+        for missing_start, missing_end in missing:
+            print(f"  Missing data from {missing_start} to {missing_end}")
+        queue.append((0.0, symbol, fetch_coverage.split_windows(missing), 0))
+    
+    # Funds are fetched concurrently; the request scheduler decides how many
+    # requests actually run. Failed windows go back on the queue after a delay.
+    cancel = threading.Event()
+    rows_by_symbol = {}
+    pending = {}
+    executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS)
+    try:
+        while queue or pending:
+            if progress_dialog.wasCanceled():
+                cancel.set()
+                break
             
-            new_data.sort(key=lambda x: x['Date'], reverse=True)
+            now = time.monotonic()
+            for job in [job for job in queue if job[0] <= now]:
+                queue.remove(job)
+                _, symbol, windows, attempt = job
+                pending[executor.submit(ingest_fund_history, symbol, windows, cancel)] = (symbol, attempt)
             
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(new_data, f, ensure_ascii=False, indent=4)
+            if pending:
+                done, _ = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+            else:
+                # Only delayed retries are left: sleep until the first is due instead of spinning
+                done = set()
+                time.sleep(min(max(min(job[0] for job in queue) - time.monotonic(), 0), PROGRESS_INTERVAL))
+            for future in done:
+                symbol, attempt = pending.pop(future)
+                rows_written, failed_windows = future.result()
+                rows_by_symbol[symbol] = rows_by_symbol.get(symbol, 0) + rows_written
+                if failed_windows and attempt + 1 < WINDOW_RETRY_ROUNDS:
+                    queue.append((time.monotonic() + WINDOW_RETRY_DELAY * (attempt + 1), symbol, failed_windows, attempt + 1))
+                    continue
+                report_fund_history(symbol, rows_by_symbol.pop(symbol), failed_windows)
+                completed += 1
             
-            print(f"  Data saved to {filename}")
-            print(f"  Number of records: {len(new_data)}")
-            print(f"  Date range: {new_data[-1]['Date']} to {new_data[0]['Date']}")
-        else:
-            print(f"  No new data available for {symbol}")
-        
-        print()  # Empty line for readability
+            # Update progress dialog with live scheduler statistics
+            progress_dialog.setValue(completed)
+            progress_dialog.setLabelText(f"Fetched {completed}/{total_funds} funds, {len(queue)} waiting for retry\n"
+                                         f"{request_scheduler.SCHEDULER.summary()}")
+            QtWidgets.QApplication.processEvents()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    
+    # Funds interrupted by a cancel keep what they wrote so far
+    for symbol, rows_written in rows_by_symbol.items():
+        if rows_written:
+            normalize.clean_fund(symbol)
     
     progress_dialog.setValue(total_funds)  # Ensure the progress dialog is complete
     print("All historical data has been retrieved and saved.")
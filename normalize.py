@@ -0,0 +1,184 @@
+import json
+import math
+import os
+
+import numpy as np
+
+import fund_store
+
+# Ingest-time validation and normalization of scraped fund data. Values are
+# typed when they arrive (Turkish number formats become floats), rows failing
+# the schema checks are dropped, and after a fetch each fund is cleaned once:
+# sorted, de-duplicated by date, isolated price spikes removed and persistent
+# split-like jumps recorded. Readers get clean typed arrays and never parse or
+# clean anything themselves.
+
+# FonAnaliz label -> value type
+FUND_INFO_TYPES = {
+    'Fon İsmi': 'text',
+    'Son Fiyat (TL)': 'number',
+    'Günlük Getiri (%)': 'number',
+    'Pay (Adet)': 'number',
+    'Fon Toplam Değer (TL)': 'number',
+    'Kategorisi': 'text',
+    'Son Bir Yıllık Kategori Derecesi': 'rank',
+    'Kategorideki Fon Sayısı': 'number',
+    'Yatırımcı Sayısı (Kişi)': 'number',
+    'Pazar Payı': 'number',
+    'Son 1 Ay Getirisi': 'number',
+    'Son 3 Ay Getirisi': 'number',
+    'Son 6 Ay Getirisi': 'number',
+    'Son 1 Yıl Getirisi': 'number',
+}
+
+# Rank label -> label the rank's denominator ("12 / 85": funds in the category) is kept under
+RANK_SIZE_LABELS = {
+    'Son Bir Yıllık Kategori Derecesi': 'Kategorideki Fon Sayısı',
+}
+
+# Labels a FonAnaliz snapshot must carry as positive numbers
+REQUIRED_FUND_INFO = ('Son Fiyat (TL)',)
+
+# Store columns that count things and can never be negative
+COUNT_COLUMNS = ('shares', 'investors', 'portfolio_size')
+
+# A day-over-day price ratio beyond this factor (either way) is a jump
+JUMP_RATIO = 1.5
+# A jump that comes back to within this distance of the previous price the next day is a spike
+SPIKE_REVERT_TOLERANCE = 0.1
+
+
+# Function to parse Turkish formatted numbers ("1.234,56", "%2,5", "-0,12") into floats.
+# Numbers pass through unchanged; anything unparsable gives None.
+def parse_turkish_number(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return None if isinstance(value, float) and math.isnan(value) else float(value)
+    cleaned = value.strip().replace('%', '').replace('.', '').replace(',', '.').replace('−', '-')
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+# Function to parse a category rank ("12 / 85") into (rank, category size)
+def parse_rank(value):
+    if isinstance(value, str) and '/' in value:
+        rank, size = value.split('/', 1)
+        return parse_turkish_number(rank), parse_turkish_number(size)
+    return parse_turkish_number(value), None
+
+
+def normalize_value(value, kind):
+    if kind == 'number':
+        return parse_turkish_number(value)
+    if kind == 'rank':
+        return parse_rank(value)[0]
+    return '' if value is None else str(value).strip()
+
+
+# Function to type the values of a FonAnaliz snapshot (unknown labels stay text).
+# Ranks are split into the rank and the size of the category.
+def normalize_fund_info(fund_info):
+    typed = {}
+    for label, value in fund_info.items():
+        kind = FUND_INFO_TYPES.get(label, 'text')
+        if kind == 'rank':
+            typed[label], size = parse_rank(value)
+            if label in RANK_SIZE_LABELS and RANK_SIZE_LABELS[label] not in fund_info:
+                typed[RANK_SIZE_LABELS[label]] = size
+        else:
+            typed[label] = normalize_value(value, kind)
+    return typed
+
+
+# Function to check a typed snapshot; returns an error message or None
+def validate_fund_info(fund_info):
+    for label in REQUIRED_FUND_INFO:
+        value = fund_info.get(label)
+        if value is None or value <= 0:
+            return f"Error: Missing or invalid '{label}'"
+    return None
+
+
+# Function to drop history rows that fail the schema checks and keep the last row per date.
+# Returns (columns, number of rows dropped).
+def normalize_history_columns(columns):
+    count = len(columns['date'])
+    dates = np.asarray(columns['date'])
+    prices = np.asarray(columns['price'], dtype=np.float64)
+    valid = (dates > fund_store.EPOCH_ORDINAL) & np.isfinite(prices) & (prices > 0)
+
+    cleaned = {}
+    for column, values in columns.items():
+        values = np.asarray(values)[valid]
+        if column in COUNT_COLUMNS:
+            values = np.where(values < 0, np.nan, values)
+        cleaned[column] = values
+    cleaned = fund_store.sort_and_dedup(cleaned)
+    return cleaned, count - len(cleaned['date'])
+
+
+# Function to find isolated price spikes (rows to drop) and persistent jumps such as
+# unit splits (kept, but reported as [date ordinal, price ratio] pairs)
+def detect_price_anomalies(dates, prices):
+    if len(prices) < 2:
+        return np.empty(0, dtype=np.int64), []
+    ratios = prices[1:] / prices[:-1]
+    jumps = np.flatnonzero((ratios > JUMP_RATIO) | (ratios < 1 / JUMP_RATIO)) + 1
+
+    spikes = []
+    for row in jumps:
+        if spikes and spikes[-1] == row - 1:
+            continue  # the move back from a spike
+        if row + 1 < len(prices) and abs(prices[row + 1] / prices[row - 1] - 1) < SPIKE_REVERT_TOLERANCE:
+            spikes.append(row)
+    spike_rows = np.array(spikes, dtype=np.int64)
+
+    skipped = set(spikes) | set((spike_rows + 1).tolist())
+    persistent = [[int(dates[row]), float(ratios[row - 1])] for row in jumps if row not in skipped]
+    return spike_rows, persistent
+
+
+def _anomalies_path(symbol):
+    return os.path.join(fund_store.fund_dir(symbol), 'anomalies.json')
+
+
+def load_anomalies(symbol):
+    try:
+        with open(_anomalies_path(symbol), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'removed_spikes': [], 'jumps': []}
+
+
+def save_anomalies(symbol, anomalies):
+    tmp_path = f"{_anomalies_path(symbol)}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(anomalies, f)
+    os.replace(tmp_path, _anomalies_path(symbol))
+
+
+# Function to clean a fund after new data was ingested: rewrite its columns sorted,
+# de-duplicated and without price spikes, and record the anomalies found
+def clean_fund(symbol):
+    # Held throughout, so no append can land between reading the columns and rewriting them
+    with fund_store.symbol_lock(symbol):
+        columns = fund_store.compact(symbol)
+        if columns is None or len(columns['date']) == 0:
+            return columns
+
+        spike_rows, jumps = detect_price_anomalies(columns['date'], columns['price'])
+        anomalies = load_anomalies(symbol)
+        if len(spike_rows):
+            removed = [[int(columns['date'][row]), float(columns['price'][row])] for row in spike_rows]
+            anomalies['removed_spikes'] = sorted(anomalies['removed_spikes'] + removed)
+            keep = np.ones(len(columns['date']), dtype=bool)
+            keep[spike_rows] = False
+            columns = {column: values[keep] for column, values in columns.items()}
+            fund_store.write_columns(symbol, columns)
+        if len(spike_rows) or jumps != anomalies['jumps']:
+            anomalies['jumps'] = jumps
+            save_anomalies(symbol, anomalies)
+    return columns
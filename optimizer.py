@@ -0,0 +1,266 @@
+import argparse
+
+import numpy as np
+
+import portfolio_store
+from panel_loader import forward_fill, load_price_panel
+
+# Portfolio construction over the fund universe. Daily returns come from the
+# aligned price panel; a pre-filter keeps the most promising candidates (plus
+# everything currently held) so the covariance matrix stays small enough to
+# optimize interactively, and the covariance is shrunk towards a scaled
+# identity (Ledoit-Wolf) because a few hundred days cannot pin down thousands
+# of correlations.
+#
+# Optimizers are long-only and fully invested:
+#   min_variance     lowest volatility
+#   mean_variance    highest return minus risk_aversion / 2 * variance
+#   risk_parity      every fund contributes the same share of the risk
+# The first two run projected gradient descent onto the capped simplex
+# (0 <= w <= max_weight, sum(w) = 1); risk parity uses cyclical coordinate
+# descent and is not capped.
+
+TRADING_DAYS_PER_YEAR = 252
+
+DEFAULT_LOOKBACK_DAYS = 252
+DEFAULT_MAX_CANDIDATES = 200
+DEFAULT_MAX_WEIGHT = 0.2
+DEFAULT_RISK_AVERSION = 5.0
+
+# Funds need real prices on this share of the lookback days to be considered
+MIN_COVERAGE = 0.9
+
+# Weight of the cross-sectional mean when estimating expected returns
+RETURN_SHRINKAGE = 0.5
+
+MAX_ITERATIONS = 2000
+TOLERANCE = 1e-10
+MIN_WEIGHT = 1e-4
+
+METHODS = ('min_variance', 'mean_variance', 'risk_parity')
+
+
+# Function to compute daily returns over the last lookback_days of the panel.
+# Returns (symbols, returns matrix days x funds) for funds with enough real prices.
+def daily_returns(panel, lookback_days=DEFAULT_LOOKBACK_DAYS):
+    prices = panel['prices'][-(lookback_days + 1):]
+    observed = (~np.isnan(prices)).mean(axis=0)
+    filled = forward_fill(prices)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = filled[1:] / filled[:-1] - 1.0
+    usable = (observed >= MIN_COVERAGE) & np.isfinite(returns).all(axis=0) & (returns.std(axis=0) > 0)
+    columns = np.flatnonzero(usable)
+    return [panel['symbols'][column] for column in columns], returns[:, columns]
+
+
+# Function to keep the max_candidates funds with the best return/volatility ratio, plus the given symbols
+def prefilter(symbols, returns, max_candidates=DEFAULT_MAX_CANDIDATES, include=()):
+    if len(symbols) <= max_candidates:
+        return symbols, returns
+    scores = returns.mean(axis=0) / returns.std(axis=0)
+    keep = set(np.argsort(-scores)[:max_candidates].tolist())
+    keep.update(column for column, symbol in enumerate(symbols) if symbol in set(include))
+    columns = sorted(keep)
+    return [symbols[column] for column in columns], returns[:, columns]
+
+
+# Function to estimate the covariance with Ledoit-Wolf shrinkage towards a scaled identity.
+# Returns (covariance, shrinkage intensity).
+def shrunk_covariance(returns):
+    days, funds = returns.shape
+    centered = returns - returns.mean(axis=0)
+    sample = centered.T @ centered / days
+    target_variance = np.trace(sample) / funds
+
+    # Distance of the sample covariance from the target, and its estimation noise
+    distance = np.sum((sample - target_variance * np.eye(funds)) ** 2)
+    squared = centered ** 2
+    noise = np.sum(squared.T @ squared) / days - np.sum(sample ** 2)
+    noise /= days
+    shrinkage = 0.0 if distance == 0 else float(np.clip(noise / distance, 0.0, 1.0))
+
+    covariance = (1 - shrinkage) * sample
+    covariance[np.diag_indices(funds)] += shrinkage * target_variance
+    return covariance, shrinkage
+
+
+# Function to project vectors onto {0 <= w <= cap, sum(w) = 1} by bisection on the shift
+def project_capped_simplex(values, cap):
+    cap = max(cap, 1.0 / len(values))
+    low, high = values.min() - cap, values.max()
+    for _ in range(100):
+        shift = (low + high) / 2
+        if np.clip(values - shift, 0, cap).sum() > 1:
+            low = shift
+        else:
+            high = shift
+    return np.clip(values - (low + high) / 2, 0, cap)
+
+
+def _largest_eigenvalue(matrix, iterations=50):
+    vector = np.ones(len(matrix)) / np.sqrt(len(matrix))
+    value = 0.0
+    for _ in range(iterations):
+        product = matrix @ vector
+        value = np.linalg.norm(product)
+        if value == 0:
+            return 0.0
+        vector = product / value
+    return value
+
+
+# Function to minimize risk_aversion / 2 * w'Cw - mu'w over the capped simplex (accelerated projected gradient)
+def _projected_gradient(covariance, expected, risk_aversion, max_weight):
+    funds = len(covariance)
+    step = 1.0 / (risk_aversion * _largest_eigenvalue(covariance))
+    weights = project_capped_simplex(np.full(funds, 1.0 / funds), max_weight)
+    momentum, t = weights.copy(), 1.0
+    for _ in range(MAX_ITERATIONS):
+        gradient = risk_aversion * (covariance @ momentum) - expected
+        updated = project_capped_simplex(momentum - step * gradient, max_weight)
+        t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        momentum = updated + (t - 1) / t_next * (updated - weights)
+        converged = np.sum((updated - weights) ** 2) < TOLERANCE
+        weights, t = updated, t_next
+        if converged:
+            break
+    return weights
+
+
+def min_variance(covariance, max_weight=DEFAULT_MAX_WEIGHT):
+    return _projected_gradient(covariance, np.zeros(len(covariance)), 1.0, max_weight)
+
+
+def mean_variance(covariance, expected, risk_aversion=DEFAULT_RISK_AVERSION, max_weight=DEFAULT_MAX_WEIGHT):
+    return _projected_gradient(covariance, expected, risk_aversion, max_weight)
+
+
+# Function to find equal risk contribution weights (Spinu's convex formulation,
+# solved coordinate by coordinate in closed form)
+def risk_parity(covariance):
+    funds = len(covariance)
+    budget = np.full(funds, 1.0 / funds)
+    diagonal = np.diag(covariance)
+    y = 1.0 / np.sqrt(diagonal)
+    for _ in range(MAX_ITERATIONS):
+        previous = y.copy()
+        for i in range(funds):
+            others = covariance[i] @ y - diagonal[i] * y[i]
+            y[i] = (-others + np.sqrt(others * others + 4 * diagonal[i] * budget[i])) / (2 * diagonal[i])
+        if np.max(np.abs(y - previous) / previous) < 1e-8:
+            break
+    return y / y.sum()
+
+
+def risk_contributions(covariance, weights):
+    marginal = covariance @ weights
+    total = weights @ marginal
+    return weights * marginal / total if total > 0 else np.zeros(len(weights))
+
+
+# Function to build an optimized portfolio over the fund universe
+def optimize(method='min_variance', lookback_days=DEFAULT_LOOKBACK_DAYS, max_candidates=DEFAULT_MAX_CANDIDATES,
+             max_weight=DEFAULT_MAX_WEIGHT, risk_aversion=DEFAULT_RISK_AVERSION, include=(), panel=None):
+    if method not in METHODS:
+        raise ValueError(f"Unknown optimization method: {method}")
+    panel = panel if panel is not None else load_price_panel()
+    symbols, returns = daily_returns(panel, lookback_days)
+    symbols, returns = prefilter(symbols, returns, max_candidates, include)
+    if not symbols:
+        return None
+
+    covariance, shrinkage = shrunk_covariance(returns)
+    means = returns.mean(axis=0)
+    expected = (1 - RETURN_SHRINKAGE) * means + RETURN_SHRINKAGE * means.mean()
+
+    if method == 'min_variance':
+        weights = min_variance(covariance, max_weight)
+    elif method == 'mean_variance':
+        weights = mean_variance(covariance, expected, risk_aversion, max_weight)
+    else:
+        weights = risk_parity(covariance)
+
+    # Drop dust positions
+    weights = np.where(weights < MIN_WEIGHT, 0.0, weights)
+    weights /= weights.sum()
+
+    variance = weights @ covariance @ weights
+    held = np.flatnonzero(weights)
+    return {
+        'method': method,
+        'symbols': [symbols[column] for column in held],
+        'weights': weights[held],
+        'risk_contributions': risk_contributions(covariance, weights)[held],
+        'expected_return': float(expected @ weights * TRADING_DAYS_PER_YEAR),
+        'volatility': float(np.sqrt(variance * TRADING_DAYS_PER_YEAR)),
+        'shrinkage': shrinkage,
+        'candidates': len(symbols),
+    }
+
+
+# Function to propose the trades that move a portfolio's holdings to the optimized weights.
+# Trades smaller than min_trade_fraction of the portfolio value are skipped.
+def propose_rebalance(result, portfolio_id=1, panel=None, cash=0.0, min_trade_fraction=0.01):
+    panel = panel if panel is not None else load_price_panel()
+    latest = forward_fill(panel['prices'])[-1]
+    price_of = dict(zip(panel['symbols'], latest))
+
+    current = portfolio_store.holdings(portfolio_store.read_portfolio(portfolio_id))
+    current_values = {symbol: quantity * price_of.get(symbol, np.nan) for symbol, quantity in current.items()}
+    total_value = cash + sum(value for value in current_values.values() if np.isfinite(value))
+    if total_value <= 0:
+        return []
+
+    targets = dict(zip(result['symbols'], result['weights']))
+    trades = []
+    for symbol in sorted(set(current) | set(targets)):
+        price = price_of.get(symbol, np.nan)
+        if not np.isfinite(price) or price <= 0:
+            continue
+        current_quantity = current.get(symbol, 0)
+        target_quantity = int(targets.get(symbol, 0.0) * total_value // price)
+        trade_quantity = target_quantity - current_quantity
+        if abs(trade_quantity * price) < min_trade_fraction * total_value:
+            continue
+        trades.append({
+            'symbol': symbol,
+            'current_weight': current_quantity * price / total_value,
+            'target_weight': float(targets.get(symbol, 0.0)),
+            'current_quantity': current_quantity,
+            'target_quantity': target_quantity,
+            'trade_quantity': trade_quantity,
+            'trade_value': trade_quantity * price,
+        })
+    return trades
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Optimize a fund portfolio over the stored universe")
+    parser.add_argument('--method', choices=METHODS, default='min_variance')
+    parser.add_argument('--lookback-days', type=int, default=DEFAULT_LOOKBACK_DAYS)
+    parser.add_argument('--max-candidates', type=int, default=DEFAULT_MAX_CANDIDATES)
+    parser.add_argument('--max-weight', type=float, default=DEFAULT_MAX_WEIGHT)
+    parser.add_argument('--risk-aversion', type=float, default=DEFAULT_RISK_AVERSION)
+    parser.add_argument('--rebalance', type=int, metavar='PORTFOLIO_ID', help="propose trades for this portfolio")
+    parser.add_argument('--cash', type=float, default=0.0, help="extra cash to invest when rebalancing")
+    args = parser.parse_args()
+
+    panel = load_price_panel()
+    include = ()
+    if args.rebalance is not None:
+        include = tuple(portfolio_store.holdings(portfolio_store.read_portfolio(args.rebalance)))
+    result = optimize(args.method, args.lookback_days, args.max_candidates, args.max_weight, args.risk_aversion, include, panel)
+    if result is None:
+        raise SystemExit("Not enough price history to optimize")
+
+    print(f"{result['method']} over {result['candidates']} candidates (covariance shrinkage {result['shrinkage']:.2f})")
+    print(f"Expected return {result['expected_return']:.2%}, volatility {result['volatility']:.2%}")
+    for symbol, weight, risk in sorted(zip(result['symbols'], result['weights'], result['risk_contributions']), key=lambda row: -row[1]):
+        print(f"  {symbol:6} {weight:7.2%}  (risk {risk:6.2%})")
+
+    if args.rebalance is not None:
+        print("\nProposed trades:")
+        for trade in propose_rebalance(result, args.rebalance, panel, args.cash):
+            action = "Buy" if trade['trade_quantity'] > 0 else "Sell"
+            print(f"  {action} {abs(trade['trade_quantity'])} of {trade['symbol']} "
+                  f"({trade['current_weight']:.2%} -> {trade['target_weight']:.2%}, {trade['trade_value']:.2f} TL)")
@@ -0,0 +1,120 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import fund_store
+
+# Loader for the whole fund universe as one aligned price panel
+# (trading days x funds, NaN where a fund has no price). Funds are read and
+# parsed across a process pool, and the finished panel is saved next to the
+# store so later loads reuse it for as long as no fund has changed.
+
+PANEL_CACHE_PATH = os.path.join('funds', 'panel_cache.npz')
+
+# Below this many funds a process pool costs more than it saves
+PARALLEL_THRESHOLD = 64
+
+
+# Function run in the worker processes: read (and if needed import) one fund
+def _load_fund(symbol):
+    columns = fund_store.read_columns(symbol)
+    if columns is None or len(columns['date']) == 0:
+        return symbol, fund_store.read_name(symbol), np.empty(0, dtype=np.int32), np.empty(0)
+    return symbol, fund_store.read_name(symbol), columns['date'], columns['price']
+
+
+def _read_funds(symbols, processes=None, mp_context=None):
+    if len(symbols) < PARALLEL_THRESHOLD or processes == 1:
+        return [_load_fund(symbol) for symbol in symbols]
+    with ProcessPoolExecutor(max_workers=processes, mp_context=mp_context) as executor:
+        chunksize = max(1, len(symbols) // ((processes or os.cpu_count() or 1) * 4))
+        return list(executor.map(_load_fund, symbols, chunksize=chunksize))
+
+
+# Function to align per-fund (dates, prices) on the union of their dates
+def align(funds):
+    all_dates = [dates for _, _, dates, _ in funds if len(dates)]
+    dates = np.unique(np.concatenate(all_dates)) if all_dates else np.empty(0, dtype=np.int32)
+
+    prices = np.full((len(dates), len(funds)), np.nan)
+    for column, (_, _, fund_dates, fund_prices) in enumerate(funds):
+        prices[np.searchsorted(dates, fund_dates), column] = fund_prices
+
+    return {
+        'symbols': [symbol for symbol, _, _, _ in funds],
+        'names': [name for _, name, _, _ in funds],
+        'dates': dates.astype(np.int32),
+        'prices': prices,
+    }
+
+
+def _manifest(symbols):
+    versions = [fund_store.source_version(symbol) or (0, 0) for symbol in symbols]
+    return np.array(versions, dtype=np.int64).reshape(len(symbols), 2)
+
+
+def _load_cached_panel(symbols, manifest):
+    try:
+        with np.load(PANEL_CACHE_PATH, allow_pickle=False) as cached:
+            if cached['symbols'].tolist() != symbols or not np.array_equal(cached['manifest'], manifest):
+                return None
+            return {
+                'symbols': symbols,
+                'names': cached['names'].tolist(),
+                'dates': cached['dates'],
+                'prices': cached['prices'],
+            }
+    except (FileNotFoundError, OSError, KeyError, ValueError):
+        return None
+
+
+def _save_panel(panel, manifest):
+    tmp_path = f"{PANEL_CACHE_PATH}.tmp.npz"
+    np.savez(tmp_path, symbols=np.array(panel['symbols'], dtype=str), names=np.array(panel['names'], dtype=str),
+             dates=panel['dates'], prices=panel['prices'], manifest=manifest)
+    os.replace(tmp_path, PANEL_CACHE_PATH)
+
+
+# Function to load the aligned price panel of the universe (or of the given symbols).
+# Callers on a background thread of a GUI pass a spawn context (mp_context), since
+# forking a process that runs other threads can deadlock the children.
+def load_price_panel(symbols=None, processes=None, use_cache=True, mp_context=None):
+    universe = fund_store.list_symbols()
+    available = set(universe)
+    selected = universe if symbols is None else [symbol for symbol in symbols if symbol in available]
+
+    if use_cache and universe:
+        manifest = _manifest(universe)
+        panel = _load_cached_panel(universe, manifest)
+        if panel is None:
+            panel = align(_read_funds(universe, processes, mp_context))
+            # Importing legacy files during the load changes their versions
+            _save_panel(panel, _manifest(universe))
+        if symbols is None:
+            return panel
+        return select(panel, selected)
+
+    return align(_read_funds(selected, processes, mp_context))
+
+
+# Function to pick a subset of funds from a panel, dropping dates none of them has
+def select(panel, symbols):
+    index = {symbol: column for column, symbol in enumerate(panel['symbols'])}
+    columns = [index[symbol] for symbol in symbols if symbol in index]
+    prices = panel['prices'][:, columns]
+    rows = ~np.isnan(prices).all(axis=1)
+    return {
+        'symbols': [panel['symbols'][column] for column in columns],
+        'names': [panel['names'][column] for column in columns],
+        'dates': panel['dates'][rows],
+        'prices': prices[rows],
+    }
+
+
+# Function to carry the last known price forward over missing days in each column
+def forward_fill(prices):
+    rows = np.arange(len(prices))[:, None]
+    last_known = np.where(~np.isnan(prices), rows, 0)
+    np.maximum.accumulate(last_known, axis=0, out=last_known)
+    return prices[last_known, np.arange(prices.shape[1])]
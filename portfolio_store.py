@@ -0,0 +1,170 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from file_lock import exclusive_lock
+
+# Portfolio files shared by several processes (GUI, CLI, cron jobs).
+#
+# Writers take an exclusive lock on a sidecar <file>.lock, re-read the ledger
+# under the lock, and commit by writing a temporary file and renaming it over
+# the original, so updates are never lost and the file is never half-written.
+# The log line for an update is appended while the lock is still held.
+# Readers do not lock at all: a rename is atomic, so they always see either
+# the previous or the new version of the whole file.
+
+PORTFOLIOS_DIR = 'portfolios'
+LOG_PATH = 'portfolio_log.txt'
+
+# Windows sometimes refuses to replace a file another process has open
+REPLACE_RETRIES = 20
+REPLACE_RETRY_DELAY = 0.05
+
+
+class PortfolioError(Exception):
+    pass
+
+
+def portfolio_path(portfolio_id):
+    return os.path.join(PORTFOLIOS_DIR, f"my_portfolio_{portfolio_id}.json")
+
+
+def _read_ledger(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            ledger = json.load(f)
+    except FileNotFoundError:
+        return []
+    except json.JSONDecodeError as e:
+        # Commits are atomic, so this is real damage: never paper over it
+        raise PortfolioError(f"{path} is not valid JSON: {e}") from e
+    if not isinstance(ledger, list):
+        raise PortfolioError(f"{path} does not contain a list of transactions")
+    return ledger
+
+
+# Function to read a consistent snapshot of a portfolio's transactions
+def read_portfolio(portfolio_id):
+    return _read_ledger(portfolio_path(portfolio_id))
+
+
+def _write_atomically(path, ledger):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(ledger, f, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    for attempt in range(REPLACE_RETRIES):
+        try:
+            os.replace(tmp_path, path)
+            return
+        except PermissionError:
+            if attempt == REPLACE_RETRIES - 1:
+                raise
+            time.sleep(REPLACE_RETRY_DELAY)
+
+
+class PortfolioTransaction:
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.log_lines = []
+
+    def next_id(self):
+        return max((entry.get('id') or 0 for entry in self.ledger), default=0) + 1
+
+    def log(self, line):
+        self.log_lines.append(line)
+
+
+# Context manager for read-modify-write updates of a portfolio. The ledger is
+# re-read under the lock; it is committed (and the log appended) only if the
+# block finishes without an exception.
+@contextmanager
+def transaction(portfolio_id, log_path=LOG_PATH):
+    path = portfolio_path(portfolio_id)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with exclusive_lock(path):
+        txn = PortfolioTransaction(_read_ledger(path))
+        yield txn
+        _write_atomically(path, txn.ledger)
+        if txn.log_lines and log_path:
+            with open(log_path, 'a', encoding='utf-8') as log_file:
+                log_file.write(''.join(f"{line}\n" for line in txn.log_lines))
+
+
+# Function to compute the quantity held per symbol from a ledger
+def holdings(ledger):
+    fund_status = {}
+    for entry in ledger:
+        symbol = entry['symbol']
+        if entry['type'] == 'buy':
+            fund_status[symbol] = fund_status.get(symbol, 0) + entry['quantity']
+        elif entry['type'] == 'sell' and symbol in fund_status:
+            fund_status[symbol] -= entry['quantity']
+            if fund_status[symbol] <= 0:
+                del fund_status[symbol]
+    return fund_status
+
+
+def _stress_writer(directory, writer, count):
+    os.chdir(directory)
+    for i in range(count):
+        with transaction(1) as txn:
+            txn.ledger.append({"portfolio_id": 1, "id": txn.next_id(), "symbol": f"W{writer}",
+                               "date": "2024-01-02", "type": "buy", "quantity": i + 1})
+            txn.log(f"Buy Fund {i + 1} of W{writer} on 2024-01-02")
+
+
+def _stress_reader(directory, stop):
+    os.chdir(directory)
+    reads = 0
+    while not stop.is_set():
+        read_portfolio(1)
+        reads += 1
+    return reads
+
+
+# Stress test: many processes appending concurrently while others keep reading.
+# Returns the final ledger, the log lines and the number of reads; every update
+# must survive, ids must be unique and readers must never see a broken file.
+def stress_test(directory, writers=16, updates=50, readers=4):
+    import multiprocessing
+
+    with multiprocessing.Manager() as manager:
+        stop = manager.Event()
+        with multiprocessing.Pool(writers + readers) as pool:
+            reader_results = [pool.apply_async(_stress_reader, (directory, stop)) for _ in range(readers)]
+            writer_results = [pool.apply_async(_stress_writer, (directory, writer, updates)) for writer in range(writers)]
+            for result in writer_results:
+                result.get()
+            stop.set()
+            reads = sum(result.get() for result in reader_results)
+
+    ledger = _read_ledger(os.path.join(directory, portfolio_path(1)))
+    with open(os.path.join(directory, LOG_PATH), 'r', encoding='utf-8') as f:
+        log_lines = f.read().splitlines()
+    return ledger, log_lines, reads
+
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Concurrent writer stress test for portfolio files")
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--updates', type=int, default=50)
+    parser.add_argument('--readers', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.monotonic()
+        ledger, log_lines, reads = stress_test(directory, args.writers, args.updates, args.readers)
+
+    expected = args.writers * args.updates
+    ids = [entry['id'] for entry in ledger]
+    print(f"{len(ledger)} of {expected} updates committed, {len(set(ids))} unique ids, "
+          f"{len(log_lines)} log lines, {reads} consistent reads in {time.monotonic() - started:.1f}s")
+    if len(ledger) != expected or len(set(ids)) != expected or len(log_lines) != expected:
+        sys.exit("Lost updates detected")
@@ -0,0 +1,115 @@
+from datetime import date
+
+# Compact record types. Fund symbols repeat across records, so they live once
+# in a StringTable and records refer to them by index, and transactions use
+# __slots__ instead of per-instance dicts. Price histories need no record type:
+# the column store and the aligned price panel (panel_loader) already keep them
+# as arrays, with each fund name stored once.
+
+
+class StringTable:
+    __slots__ = ('strings', '_ids')
+
+    def __init__(self):
+        self.strings = []
+        self._ids = {}
+
+    def intern(self, value):
+        index = self._ids.get(value)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(value)
+            self._ids[value] = index
+        return index
+
+    def __getitem__(self, index):
+        return self.strings[index]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+# Shared table of fund symbols
+SYMBOLS = StringTable()
+
+
+class Transaction:
+    __slots__ = ('portfolio_id', 'id', 'symbol_id', 'date', 'is_buy', 'quantity')
+
+    def __init__(self, portfolio_id, id, symbol, date, is_buy, quantity):
+        self.portfolio_id = portfolio_id
+        self.id = id
+        self.symbol_id = SYMBOLS.intern(symbol)
+        self.date = date
+        self.is_buy = is_buy
+        self.quantity = quantity
+
+    # Function to build a transaction from a portfolio file entry (None for malformed entries)
+    @classmethod
+    def from_dict(cls, entry):
+        try:
+            if entry['type'] not in ('buy', 'sell'):
+                return None
+            return cls(entry.get('portfolio_id', 1), entry.get('id'), entry['symbol'],
+                       date.fromisoformat(entry['date']).toordinal(), entry['type'] == 'buy', entry['quantity'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def to_dict(self):
+        return {
+            "portfolio_id": self.portfolio_id,
+            "id": self.id,
+            "symbol": self.symbol,
+            "date": date.fromordinal(self.date).isoformat(),
+            "type": "buy" if self.is_buy else "sell",
+            "quantity": self.quantity,
+        }
+
+    @property
+    def symbol(self):
+        return SYMBOLS[self.symbol_id]
+
+    @property
+    def signed_quantity(self):
+        return self.quantity if self.is_buy else -self.quantity
+
+
+def load_transactions(ledger):
+    return [transaction for transaction in map(Transaction.from_dict, ledger) if transaction is not None]
+
+
+if __name__ == '__main__':
+    # Memory of the shipped representations against the dicts they replaced
+    # (run from a directory holding a fund store)
+    import gc
+    import time
+    import tracemalloc
+
+    import fund_store
+    from panel_loader import load_price_panel
+
+    def measure(label, build):
+        gc.collect()
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = build()
+        retained, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label:32} {retained / 2**20:8.1f} MiB {time.perf_counter() - started:6.1f} s")
+        return result
+
+    def row_dicts(symbol):
+        columns = fund_store.read_columns(symbol)
+        name = fund_store.read_name(symbol)
+        return [{'Date': day, 'Symbol': symbol, 'Name': name, 'Price': price}
+                for day, price in zip(fund_store.ordinals_to_iso(columns['date']).tolist(), columns['price'].tolist())]
+
+    symbols = fund_store.list_symbols()
+    print(f"{len(symbols)} funds")
+    measure("price rows as dicts", lambda: {symbol: row_dicts(symbol) for symbol in symbols})
+    measure("price panel", lambda: load_price_panel(processes=1, use_cache=False))
+
+    ledger = [{'portfolio_id': 1, 'id': i, 'symbol': symbols[i % len(symbols)], 'date': '2024-01-02',
+               'type': 'buy', 'quantity': 10} for i in range(100_000)]
+    measure("100k ledger entries as dicts", lambda: [dict(entry) for entry in ledger])
+    measure("100k Transaction records", lambda: load_transactions(ledger))
@@ -0,0 +1,203 @@
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+
+# Adaptive scheduler for all outgoing scraper requests. Each endpoint
+# (host + path) gets its own concurrency limit that grows by one slot per
+# round of successful requests and is halved on throttling or server errors
+# (AIMD). Retry-After is honoured by pausing the whole endpoint, and latency,
+# error rate and throughput are tracked so the progress UI can show them.
+
+INITIAL_CONCURRENCY = 2
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 16
+DECREASE_FACTOR = 0.5
+
+# Latency above this multiple of the best latency seen stops further increases
+LATENCY_TOLERANCE = 2.0
+LATENCY_SMOOTHING = 0.2
+
+# Attempts per request on throttling / server errors, with exponential backoff
+MAX_ATTEMPTS = 4
+BACKOFF_SECONDS = 1.0
+MAX_RETRY_AFTER = 300
+
+# Window (in seconds) over which throughput is measured
+THROUGHPUT_WINDOW = 10.0
+
+THROTTLE_STATUSES = (429, 503)
+
+# Seconds to wait for a connection and between bytes of a response. A request
+# that hangs past these fails like any other error, so its slot is given back.
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+
+
+def endpoint_of(url):
+    parts = urlsplit(url)
+    return f"{parts.netloc}{parts.path}"
+
+
+# Function to read a Retry-After header (seconds or HTTP date) as a delay in seconds
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0.0), MAX_RETRY_AFTER)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.limit = float(INITIAL_CONCURRENCY)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.latency = None
+        self.best_latency = None
+        self.last_decrease = 0.0
+        self.completed = deque()
+
+    def _trim(self, now):
+        while self.completed and now - self.completed[0] > THROUGHPUT_WINDOW:
+            self.completed.popleft()
+
+    def record_completion(self, now):
+        self.completed.append(now)
+        self._trim(now)
+
+    def snapshot(self, now):
+        self._trim(now)
+        return {
+            'concurrency': int(self.limit),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'error_rate': self.errors / self.requests if self.requests else 0.0,
+            'throttled': self.throttled,
+            'latency': self.latency,
+            'throughput': len(self.completed) / THROUGHPUT_WINDOW,
+            'paused_for': max(self.paused_until - now, 0.0),
+        }
+
+
+class AdaptiveScheduler:
+    def __init__(self):
+        self.endpoints = {}
+        self.condition = threading.Condition()
+
+    def _stats(self, endpoint):
+        stats = self.endpoints.get(endpoint)
+        if stats is None:
+            stats = self.endpoints[endpoint] = EndpointStats()
+        return stats
+
+    # Function to wait for a free slot on an endpoint
+    def acquire(self, endpoint):
+        with self.condition:
+            stats = self._stats(endpoint)
+            while True:
+                wait = stats.paused_until - time.monotonic()
+                if wait <= 0 and stats.in_flight < int(stats.limit):
+                    stats.in_flight += 1
+                    return
+                self.condition.wait(timeout=wait if wait > 0 else None)
+
+    # Function to report the outcome of a request and adapt the endpoint's limit
+    def release(self, endpoint, latency, ok, throttled=False, retry_after=None):
+        with self.condition:
+            stats = self._stats(endpoint)
+            now = time.monotonic()
+            stats.in_flight -= 1
+            stats.requests += 1
+            stats.record_completion(now)
+
+            if ok:
+                stats.latency = latency if stats.latency is None else (1 - LATENCY_SMOOTHING) * stats.latency + LATENCY_SMOOTHING * latency
+                stats.best_latency = latency if stats.best_latency is None else min(stats.best_latency, latency)
+                # Additive increase: one more slot per `limit` successes, unless the server is slowing down
+                if stats.latency <= LATENCY_TOLERANCE * stats.best_latency:
+                    stats.limit = min(stats.limit + 1.0 / stats.limit, MAX_CONCURRENCY)
+            else:
+                stats.errors += 1
+                stats.throttled += throttled
+                # Multiplicative decrease, at most once per round trip so one burst of failures counts once
+                if now - stats.last_decrease > (stats.latency or latency):
+                    stats.limit = max(stats.limit * DECREASE_FACTOR, MIN_CONCURRENCY)
+                    stats.last_decrease = now
+                if retry_after:
+                    stats.paused_until = max(stats.paused_until, now + retry_after)
+            self.condition.notify_all()
+
+    # Function to perform an HTTP request under the scheduler, retrying throttled
+    # and failed attempts with Retry-After or exponential backoff
+    def request(self, method, url, **kwargs):
+        endpoint = endpoint_of(url)
+        kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+        for attempt in range(MAX_ATTEMPTS):
+            last_attempt = attempt == MAX_ATTEMPTS - 1
+            self.acquire(endpoint)
+            started = time.monotonic()
+            try:
+                response = requests.request(method, url, **kwargs)
+            except requests.RequestException:  # includes requests.Timeout
+                self.release(endpoint, time.monotonic() - started, ok=False)
+                if last_attempt:
+                    raise
+                time.sleep(BACKOFF_SECONDS * 2 ** attempt)
+                continue
+
+            # Latency is the time to the response headers; the caller streams the body
+            latency = time.monotonic() - started
+            throttled = response.status_code in THROTTLE_STATUSES
+            if not throttled and response.status_code < 500:
+                self.release(endpoint, latency, ok=True)
+                return response
+
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            self.release(endpoint, latency, ok=False, throttled=throttled, retry_after=retry_after)
+            if last_attempt:
+                return response
+            response.close()
+            if retry_after is None:
+                time.sleep(BACKOFF_SECONDS * 2 ** attempt)
+
+    # Function to get live statistics per endpoint
+    def stats(self):
+        with self.condition:
+            now = time.monotonic()
+            return {endpoint: stats.snapshot(now) for endpoint, stats in self.endpoints.items()}
+
+    # Function to summarize all endpoints in one line for progress displays
+    def summary(self):
+        stats = self.stats().values()
+        if not stats:
+            return ""
+        in_flight = sum(endpoint['in_flight'] for endpoint in stats)
+        concurrency = sum(endpoint['concurrency'] for endpoint in stats)
+        throughput = sum(endpoint['throughput'] for endpoint in stats)
+        requests_made = sum(endpoint['requests'] for endpoint in stats)
+        errors = sum(endpoint['error_rate'] * endpoint['requests'] for endpoint in stats)
+        line = f"{in_flight}/{concurrency} in flight, {throughput:.1f} req/s, {errors / max(requests_made, 1):.0%} errors"
+        paused = max(endpoint['paused_for'] for endpoint in stats)
+        if paused:
+            line += f", paused {paused:.1f}s (Retry-After)"
+        return line
+
+
+# Scheduler shared by all scraper traffic
+SCHEDULER = AdaptiveScheduler()
+
+
+def request(method, url, **kwargs):
+    return SCHEDULER.request(method, url, **kwargs)
@@ -0,0 +1,164 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import portfolio_store
+from optimizer import shrunk_covariance
+from panel_loader import forward_fill, load_price_panel, select
+
+# Forward-looking risk of a portfolio's current holdings. Outcomes over a
+# horizon are simulated from the historical daily log returns of the held
+# funds, either by a moving block bootstrap (resampling blocks of consecutive
+# days, which keeps short-term dependence and the cross-fund correlation of
+# each day) or by a parametric Monte Carlo (multivariate normal with a shrunk
+# covariance). Holdings are buy-and-hold over the horizon.
+#
+# Paths are generated in batches of array operations. Every batch gets its own
+# child of one SeedSequence, so a given seed gives the same outcomes whether
+# the batches run in one process or across a pool.
+
+METHODS = ('bootstrap', 'parametric')
+
+DEFAULT_HORIZON_DAYS = 21
+DEFAULT_PATHS = 100_000
+DEFAULT_BLOCK_LENGTH = 10
+DEFAULT_LOOKBACK_DAYS = 3 * 252
+CONFIDENCE_LEVELS = (0.95, 0.99)
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+HISTOGRAM_BINS = 50
+
+BATCH_PATHS = 25_000
+
+
+# Function to simulate the growth factor of every fund over the horizon by block bootstrap (paths x funds)
+def bootstrap_growth(log_returns, horizon, paths, block_length, rng):
+    days, funds = log_returns.shape
+    block_length = max(1, min(block_length, days))
+    # Sums over blocks come from differences of the running sum
+    prefix = np.vstack([np.zeros((1, funds)), np.cumsum(log_returns, axis=0)])
+    blocks, tail = divmod(horizon, block_length)
+
+    total = np.zeros((paths, funds))
+    for length in [block_length] * blocks + ([tail] if tail else []):
+        starts = rng.integers(0, days - length + 1, size=paths)
+        total += prefix[starts + length] - prefix[starts]
+    return np.exp(total)
+
+
+# Function to simulate fund growth factors from a multivariate normal fitted to daily log returns
+def parametric_growth(log_returns, horizon, paths, rng):
+    mean = log_returns.mean(axis=0)
+    covariance, _ = shrunk_covariance(log_returns)
+    # Factor via eigendecomposition, which also copes with singular covariances
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    factor = eigenvectors * np.sqrt(np.maximum(eigenvalues, 0))
+    shocks = rng.standard_normal((paths, len(mean))) @ factor.T
+    return np.exp(horizon * mean + np.sqrt(horizon) * shocks)
+
+
+# Function run in the worker processes: terminal portfolio values of one batch of paths
+def _simulate_batch(method, log_returns, position_values, horizon, paths, block_length, seed):
+    rng = np.random.default_rng(seed)
+    if method == 'bootstrap':
+        growth = bootstrap_growth(log_returns, horizon, paths, block_length, rng)
+    else:
+        growth = parametric_growth(log_returns, horizon, paths, rng)
+    return growth @ position_values
+
+
+# Function to simulate terminal values of positions (TL per fund) given the funds' daily log returns
+def simulate_values(log_returns, position_values, method='bootstrap', horizon=DEFAULT_HORIZON_DAYS, paths=DEFAULT_PATHS,
+                    block_length=DEFAULT_BLOCK_LENGTH, seed=None, processes=None, mp_context=None):
+    if method not in METHODS:
+        raise ValueError(f"Unknown simulation method: {method}")
+    batches = [min(BATCH_PATHS, paths - start) for start in range(0, paths, BATCH_PATHS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batches))
+    jobs = [(method, log_returns, position_values, horizon, batch, block_length, batch_seed)
+            for batch, batch_seed in zip(batches, seeds)]
+
+    workers = processes or os.cpu_count() or 1
+    if len(jobs) == 1 or workers == 1:
+        return np.concatenate([_simulate_batch(*job) for job in jobs])
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=mp_context) as executor:
+        return np.concatenate(list(executor.map(_simulate_batch, *zip(*jobs))))
+
+
+# Function to summarize simulated profit/loss: VaR and CVaR (as positive losses) and the outcome distribution
+def risk_report(pnl, value, levels=CONFIDENCE_LEVELS):
+    report = {'value': value, 'paths': len(pnl), 'mean': float(pnl.mean()),
+              'probability_of_loss': float((pnl < 0).mean())}
+    for level in levels:
+        var = -np.quantile(pnl, 1 - level)
+        tail = pnl[pnl <= -var]
+        report[f'var_{level:.0%}'] = float(var)
+        report[f'cvar_{level:.0%}'] = float(-tail.mean()) if len(tail) else float(var)
+    report['percentiles'] = dict(zip(PERCENTILES, np.percentile(pnl, PERCENTILES).tolist()))
+    counts, edges = np.histogram(pnl, bins=HISTOGRAM_BINS)
+    report['histogram'] = (counts, edges)
+    return report
+
+
+# Function to value a portfolio's holdings at the latest prices and get their daily log returns
+def holdings_returns(portfolio_id=1, lookback_days=DEFAULT_LOOKBACK_DAYS, panel=None, mp_context=None):
+    holdings = portfolio_store.holdings(portfolio_store.read_portfolio(portfolio_id))
+    panel = panel if panel is not None else load_price_panel(mp_context=mp_context)
+    panel = select(panel, sorted(holdings))
+    if not panel['symbols'] or len(panel['dates']) < 2:
+        return None
+
+    prices = forward_fill(panel['prices'][-(lookback_days + 1):])
+    latest = prices[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_returns = np.log(prices[1:] / prices[:-1])
+    # Days before a fund's first price carry no information about it
+    log_returns = np.nan_to_num(log_returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+    priced = np.isfinite(latest) & (latest > 0)
+    symbols = [symbol for symbol, ok in zip(panel['symbols'], priced) if ok]
+    return {
+        'symbols': symbols,
+        'position_values': np.array([holdings[symbol] for symbol in symbols]) * latest[priced],
+        'log_returns': log_returns[:, priced],
+    }
+
+
+# Function to simulate the risk of a portfolio's current holdings over horizon_days trading days.
+# mp_context is the multiprocessing context of the process pools (see load_price_panel).
+def simulate_portfolio(portfolio_id=1, method='bootstrap', horizon=DEFAULT_HORIZON_DAYS, paths=DEFAULT_PATHS,
+                       block_length=DEFAULT_BLOCK_LENGTH, lookback_days=DEFAULT_LOOKBACK_DAYS, seed=None,
+                       processes=None, panel=None, mp_context=None):
+    positions = holdings_returns(portfolio_id, lookback_days, panel, mp_context)
+    if positions is None or not positions['symbols']:
+        return None
+    value = float(positions['position_values'].sum())
+    terminal = simulate_values(positions['log_returns'], positions['position_values'], method, horizon, paths,
+                               block_length, seed, processes, mp_context)
+    report = risk_report(terminal - value, value)
+    report.update({'method': method, 'horizon': horizon, 'symbols': positions['symbols']})
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Monte Carlo / bootstrap risk of a portfolio's holdings")
+    parser.add_argument('--portfolio', type=int, default=1)
+    parser.add_argument('--method', choices=METHODS, default='bootstrap')
+    parser.add_argument('--horizon', type=int, default=DEFAULT_HORIZON_DAYS, help="trading days")
+    parser.add_argument('--paths', type=int, default=DEFAULT_PATHS)
+    parser.add_argument('--block-length', type=int, default=DEFAULT_BLOCK_LENGTH)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--processes', type=int)
+    args = parser.parse_args()
+
+    report = simulate_portfolio(args.portfolio, args.method, args.horizon, args.paths, args.block_length,
+                                seed=args.seed, processes=args.processes)
+    if report is None:
+        raise SystemExit("No priced holdings to simulate")
+
+    print(f"{report['method']} over {report['horizon']} trading days, {report['paths']} paths, value {report['value']:.2f} TL")
+    for level in CONFIDENCE_LEVELS:
+        print(f"  VaR {level:.0%}: {report[f'var_{level:.0%}']:.2f} TL   CVaR {level:.0%}: {report[f'cvar_{level:.0%}']:.2f} TL")
+    print(f"  Mean P/L: {report['mean']:.2f} TL, probability of loss {report['probability_of_loss']:.1%}")
+    for percentile, pnl in report['percentiles'].items():
+        print(f"  P{percentile:<2}: {pnl:12.2f} TL")
@@ -1,43 +1,44 @@
 # Import necessary modules
-import json
-from datetime import date, datetime, timedelta
-import os
+from datetime import date, timedelta
 import numpy as np
+from execution import CASH, ExecutionModel, execute, fund_types_from_archive
+from panel_loader import forward_fill, load_price_panel
+
+# Trading days between two looks at the RSI signal
+REBALANCE_INTERVAL = 20
 
 # Define the main simulation function
-def simulate_best_fund(starting_money):
-    # Load all fund data from JSON files
-    funds_data = load_all_funds_data()
-    # After line 10
-    print(f"Number of funds loaded: {len(funds_data)}")
-    
+def simulate_best_fund(starting_money, model=None):
+    # Load the aligned price panel of all funds
+    panel = load_price_panel()
+    print(f"Number of funds loaded: {len(panel['symbols'])}")
+    # Equity funds are exempt from withholding tax, so the model needs each fund's category
+    model = model or ExecutionModel(fund_types=fund_types_from_archive(panel['symbols']))
+
     # Set simulation parameters
-    start_date = datetime.now() - timedelta(days=5*365)  # Start date is 5 years ago
-    end_date = datetime.now() - timedelta(days=7)  # End date is a week ago
-    current_date = start_date  # Start simulation from the beginning
-    portfolio = {'cash': starting_money, 'fund': None, 'shares': 0}  # Initialize portfolio
+    start_date = date.today() - timedelta(days=5*365)  # Start date is 5 years ago
+    end_date = date.today() - timedelta(days=7)  # End date is a week ago
+    start_row = int(np.searchsorted(panel['dates'], start_date.toordinal()))
+    end_row = int(np.searchsorted(panel['dates'], end_date.toordinal(), side='right'))
+    if end_row - start_row < 2:
+        print("Not enough price history to simulate")
+        return None
+
+    # Every REBALANCE_INTERVAL trading days switch to the fund with the lowest RSI
+    rsi = rolling_rsi(panel['prices'])[start_row:end_row]
+    rebalance_rows = np.arange(0, end_row - start_row, REBALANCE_INTERVAL)
+    signal = np.where(np.isnan(rsi[rebalance_rows]), np.inf, rsi[rebalance_rows])
+    choices = np.where(np.isinf(signal).all(axis=1), CASH, np.argmin(signal, axis=1))
+    targets = np.repeat(choices, REBALANCE_INTERVAL)[:end_row - start_row]
 
-    # Main simulation loop
-    # Replace lines 21-24 with:
-    for fund_symbol, fund_data in funds_data.items():
-        rsi = calculate_rsi(fund_data, current_date)
-        print(f"{fund_symbol} RSI calculation result: {rsi}")
-        if rsi is not None:
-            print(f"{fund_symbol} RSI: {rsi:.2f}")
-        else:
-            print(f"Unable to calculate RSI for {fund_symbol} on {current_date}")
-            if rsi is not None:
-                print(f"{fund_symbol} RSI: {rsi:.2f}")
-        
-        if portfolio['fund']:
-            price = get_fund_price(funds_data, portfolio['fund'], current_date)
-            if price is not None:
-                print(f"{portfolio['fund']}: ${price:.2f}")
-        
-        current_date += timedelta(days=1)  # Move to the next day
+    prices = forward_fill(panel['prices'])[start_row:end_row]
+    result = execute(targets, prices, panel['symbols'], starting_money, model)
 
-    # Calculate and print final performance (which will be unchanged)
-    final_value = portfolio['cash']
+    for fund, buy_day in zip(result['funds'], result['buy_days']):
+        print(f"{date.fromordinal(int(panel['dates'][start_row + buy_day]))}: bought {panel['symbols'][fund]}")
+
+    # Calculate and print final performance
+    final_value = result['final_value']
     total_gain_loss = final_value - starting_money
     total_percentage = (total_gain_loss / starting_money) * 100
     print(f"\nFinal Results:")
@@ -45,45 +46,30 @@ def simulate_best_fund(starting_money):
     print(f"Ending Amount: ${final_value:.2f}")
     print(f"Total Gain/Loss: ${total_gain_loss:.2f}")
     print(f"Total Percentage: {total_percentage:.2f}%")
+    print(f"Trades: {len(result['funds'])}, Fees: ${result['fees']:.2f}, Taxes: ${result['taxes']:.2f}")
+    return result
 
-# Function to load all fund data from JSON files
-def load_all_funds_data():
-    funds_data = {}
-    funds_dir = 'funds'
-    for filename in os.listdir(funds_dir):
-        if filename.endswith('.json'):
-            fund_symbol = filename[:-5]  # Remove .json extension
-            with open(os.path.join(funds_dir, filename), 'r') as f:
-                fund_data = json.load(f)
-                funds_data[fund_symbol] = {datetime.strptime(item['Date'], '%Y-%m-%d').date(): item for item in fund_data}
-    return funds_data
-
-# Function to get the price of a fund on a specific date
-def get_fund_price(funds_data, fund_symbol, date):
-    print(f"Calculating RSI for date: {current_date}, data points: {len(fund_data)}")
-    if fund_symbol in funds_data and date.date() in funds_data[fund_symbol]:
-        return float(funds_data[fund_symbol][date.date()]['Price'])
-    return None
+# Function to calculate the RSI of every fund on every day of a price panel
+# (simple averages of the last period gains and losses; NaN where a window has a missing price).
+# A window with gains and no losses scores 0 for the simulator's ranking, or the
+# textbook 100 with saturate=True.
+def rolling_rsi(prices, period=14, saturate=False):
+    deltas = np.nan_to_num(np.diff(prices, axis=0))
+    zeros = np.zeros((1, prices.shape[1]))
+    ups = np.concatenate([zeros, np.cumsum(np.where(deltas >= 0, deltas, 0), axis=0)])
+    downs = np.concatenate([zeros, np.cumsum(np.where(deltas < 0, -deltas, 0), axis=0)])
+    missing = np.concatenate([zeros, np.cumsum(np.isnan(prices), axis=0)])
 
-# Function to calculate RSI
-def calculate_rsi(fund_data, current_date, period=14):
-    prices = []
-    date = current_date.date()
-    while len(prices) < period + 1 and date in fund_data:
-        prices.append(float(fund_data[date]['Price']))
-        date -= timedelta(days=1)
-    
-    if len(prices) < period + 1:
-        return None
-    
-    prices.reverse()
-    deltas = np.diff(prices)
-    seed = deltas[:period]
-    up = seed[seed >= 0].sum()/period
-    down = -seed[seed < 0].sum()/period
-    rs = up/down if down != 0 else 0
-    rsi = 100 - (100/(1+rs))
+    rsi = np.full(prices.shape, np.nan)
+    up = (ups[period:] - ups[:-period]) / period
+    down = (downs[period:] - downs[:-period]) / period
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = np.where(down != 0, up / down, np.where(saturate & (up > 0), np.inf, 0))
+    complete = (missing[period + 1:] - missing[:-period - 1]) == 0
+    rsi[period:] = np.where(complete, 100 - (100 / (1 + rs)), np.nan)
     return rsi
 
 # Example usage of the simulation function
-simulate_best_fund(10000)  # Start simulation with $10,000
+# (guarded so worker processes of the panel loader can import this module)
+if __name__ == "__main__":
+    simulate_best_fund(10000)  # Start simulation with $10,000
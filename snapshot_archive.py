@@ -0,0 +1,206 @@
+import json
+import os
+import re
+from datetime import date
+
+import numpy as np
+
+import normalize
+
+# Archive of the daily FonAnaliz snapshots taken by get_todays_data. Each day is
+# one compressed partition (archive/snapshots/<YEAR>/<YYYY-MM-DD>.npz) holding
+# one array per field, so a question about a single field over time only
+# decompresses that field from each partition. A schema registry maps the
+# Turkish page labels to stable column names and types; columns are only ever
+# added to it, and partitions written before a column existed read as missing.
+
+ARCHIVE_DIR = 'archive'
+SNAPSHOT_DIR = os.path.join(ARCHIVE_DIR, 'snapshots')
+SCHEMA_PATH = os.path.join(ARCHIVE_DIR, 'schema.json')
+
+# Known FonAnaliz labels -> (column, type)
+DEFAULT_SCHEMA = {
+    'Fon İsmi': ('name', 'text'),
+    'Son Fiyat (TL)': ('price', 'number'),
+    'Günlük Getiri (%)': ('daily_return', 'number'),
+    'Pay (Adet)': ('shares', 'number'),
+    'Fon Toplam Değer (TL)': ('portfolio_size', 'number'),
+    'Kategorisi': ('category', 'text'),
+    'Son Bir Yıllık Kategori Derecesi': ('category_rank', 'rank'),
+    'Kategorideki Fon Sayısı': ('category_size', 'number'),
+    'Yatırımcı Sayısı (Kişi)': ('investors', 'number'),
+    'Pazar Payı': ('market_share', 'number'),
+    'Son 1 Ay Getirisi': ('return_1m', 'number'),
+    'Son 3 Ay Getirisi': ('return_3m', 'number'),
+    'Son 6 Ay Getirisi': ('return_6m', 'number'),
+    'Son 1 Yıl Getirisi': ('return_1y', 'number'),
+}
+
+TURKISH_ASCII = str.maketrans('çğıöşüÇĞİÖŞÜ', 'cgiosuCGIOSU')
+
+
+# Function to convert a (typed) snapshot value to the archive column type
+def archive_value(value, kind):
+    value = normalize.normalize_value(value, kind)
+    return np.nan if value is None else value
+
+
+# Function to derive a column name for a label the registry has not seen yet
+def column_name(label):
+    name = re.sub(r'[^0-9a-z]+', '_', label.translate(TURKISH_ASCII).lower())
+    return name.strip('_') or 'field'
+
+
+def load_schema():
+    try:
+        with open(SCHEMA_PATH, 'r', encoding='utf-8') as f:
+            return {label: tuple(entry) for label, entry in json.load(f).items()}
+    except (FileNotFoundError, json.JSONDecodeError):
+        return dict(DEFAULT_SCHEMA)
+
+
+def save_schema(schema):
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    tmp_path = f"{SCHEMA_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(schema, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, SCHEMA_PATH)
+
+
+# Function to register labels seen on the page. Labels added to DEFAULT_SCHEMA after
+# a registry was created get their default column; unknown labels are kept as text.
+def register_labels(schema, labels):
+    columns = {column for column, _ in schema.values()}
+    added = False
+    for label in labels:
+        if label in schema:
+            continue
+        if label in DEFAULT_SCHEMA and DEFAULT_SCHEMA[label][0] not in columns:
+            schema[label] = DEFAULT_SCHEMA[label]
+            columns.add(DEFAULT_SCHEMA[label][0])
+            added = True
+            continue
+        column = base = column_name(label)
+        suffix = 2
+        while column in columns:
+            column = f"{base}_{suffix}"
+            suffix += 1
+        schema[label] = (column, 'text')
+        columns.add(column)
+        added = True
+    return added
+
+
+def partition_path(day):
+    return os.path.join(SNAPSHOT_DIR, str(day.year), f"{day.isoformat()}.npz")
+
+
+# Function to store one day's snapshots, given as {symbol: fund_info dict}
+def write_snapshot(day, snapshots):
+    schema = load_schema()
+    if register_labels(schema, {label for fund_info in snapshots.values() for label in fund_info}) or not os.path.exists(SCHEMA_PATH):
+        save_schema(schema)
+
+    symbols = sorted(snapshots)
+    arrays = {'symbol': np.array(symbols, dtype=str)}
+    for label, (column, kind) in schema.items():
+        values = [archive_value(snapshots[symbol].get(label), kind) for symbol in symbols]
+        arrays[column] = np.array(values, dtype=str if kind == 'text' else np.float64)
+
+    path = partition_path(day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    return path
+
+
+# Function to list the archived days between start and end (inclusive)
+def list_partitions(start=None, end=None):
+    days = []
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return days
+    for year in os.listdir(SNAPSHOT_DIR):
+        for filename in os.listdir(os.path.join(SNAPSHOT_DIR, year)):
+            if not filename.endswith('.npz') or '.tmp' in filename:
+                continue
+            try:
+                day = date.fromisoformat(filename[:-4])
+            except ValueError:
+                continue
+            if (start is None or day >= start) and (end is None or day <= end):
+                days.append(day)
+    return sorted(days)
+
+
+def _column_kinds():
+    kinds = {'symbol': 'text'}
+    kinds.update({column: kind for column, kind in load_schema().values()})
+    return kinds
+
+
+# Function to read the given columns across days. `where` maps a column to a value
+# (or a predicate taking the column array) that rows must match; `symbols` limits
+# the funds. Returns concatenated arrays plus 'date' ordinals and 'symbol'.
+def scan(columns, start=None, end=None, symbols=None, where=None):
+    where = where or {}
+    kinds = _column_kinds()
+    wanted = list(dict.fromkeys(['symbol'] + list(columns) + list(where)))
+    unknown = [column for column in wanted if column not in kinds]
+    if unknown:
+        raise KeyError(f"Unknown archive columns: {', '.join(unknown)}")
+    symbol_filter = None if symbols is None else np.array(sorted(symbols), dtype=str)
+
+    parts = {column: [] for column in wanted}
+    parts['date'] = []
+    for day in list_partitions(start, end):
+        with np.load(partition_path(day), allow_pickle=False) as partition:
+            count = len(partition['symbol'])
+            data = {}
+            for column in wanted:
+                if column in partition.files:
+                    data[column] = partition[column]
+                elif kinds[column] == 'text':
+                    data[column] = np.full(count, '', dtype=str)
+                else:
+                    data[column] = np.full(count, np.nan)
+
+        mask = np.ones(count, dtype=bool)
+        if symbol_filter is not None:
+            mask &= np.isin(data['symbol'], symbol_filter)
+        for column, condition in where.items():
+            mask &= condition(data[column]) if callable(condition) else data[column] == condition
+
+        for column in wanted:
+            parts[column].append(data[column][mask])
+        parts['date'].append(np.full(int(mask.sum()), day.toordinal(), dtype=np.int32))
+
+    result = {}
+    for column, arrays in parts.items():
+        if arrays:
+            result[column] = np.concatenate(arrays)
+        elif column == 'date':
+            result[column] = np.empty(0, dtype=np.int32)
+        else:
+            result[column] = np.empty(0, dtype=str if kinds[column] == 'text' else np.float64)
+    return result
+
+
+# Function to get each fund's most recent non-missing value of a column
+def latest_values(column, symbols=None):
+    scanned = scan([column], symbols=symbols)
+    values = scanned[column]
+    present = values != '' if values.dtype.kind in 'US' else ~np.isnan(values)
+    # Partitions are scanned in date order: the first row of each symbol in reverse is its latest
+    reversed_symbols = scanned['symbol'][present][::-1]
+    symbols_found, rows = np.unique(reversed_symbols, return_index=True)
+    return dict(zip(symbols_found.tolist(), values[present][::-1][rows].tolist()))
+
+
+# Function to pivot one numeric column into a (days x symbols) matrix, NaN where missing
+def pivot(scanned, column):
+    dates, date_rows = np.unique(scanned['date'], return_inverse=True)
+    symbols, symbol_columns = np.unique(scanned['symbol'], return_inverse=True)
+    matrix = np.full((len(dates), len(symbols)), np.nan)
+    matrix[date_rows, symbol_columns] = scanned[column]
+    return dates, symbols.tolist(), matrix
@@ -0,0 +1,18 @@
+import numpy as np
+
+import chart_overlays
+from sim import rolling_rsi
+
+
+def test_rsi_of_rising_prices_is_100():
+    values = chart_overlays.rsi(np.arange(1.0, 30.0), 14)
+    assert np.all(np.isnan(values[:14]))
+    assert np.all(values[14:] == 100)
+
+
+def test_rsi_of_falling_prices_is_0():
+    assert np.all(chart_overlays.rsi(np.arange(30.0, 1.0, -1), 14)[14:] == 0)
+
+
+def test_simulator_ranks_windows_without_losses_first():
+    assert rolling_rsi(np.arange(1.0, 30.0)[:, None])[-1, 0] == 0
@@ -0,0 +1,39 @@
+import numpy as np
+
+from execution import CASH, ExecutionModel, execute, schedule_trades
+
+
+def schedule(targets, lags):
+    funds, buy_days, sell_days = schedule_trades(np.array(targets, dtype=np.int64), np.array(lags, dtype=np.int64))
+    return funds.tolist(), buy_days.tolist(), sell_days.tolist()
+
+
+def test_target_before_settlement_is_carried_out_when_settled():
+    # Fund 0 settles on day 3; the switch to fund 1 signalled on day 2 starts then,
+    # but its purchase would only settle after the last day, so the run ends in cash
+    assert schedule([0, 0, 1, 1, 1, 1, 1, 1], [3, 3]) == ([0], [3], [6])
+
+
+def test_pending_target_is_bought():
+    assert schedule([0, 0, 1, 1, 1, 1, 1, 1], [3, 1]) == ([0, 1], [3, 7], [6])
+
+
+def test_only_latest_pending_target_is_kept():
+    # Fund 1 is wanted only while fund 0 settles; by day 3 the target is fund 2
+    assert schedule([0, 1, 2, 2, 2, 2, 2, 2], [3, 1, 1]) == ([0, 2], [3, 7], [6])
+
+
+def test_target_reverted_before_settlement_is_dropped():
+    assert schedule([0, 1, 0, 0, 0, 0], [2, 1]) == ([0], [2], [])
+
+
+def test_switch_to_cash():
+    assert schedule([0, 0, CASH, CASH, 1, 1, 1], [1, 1]) == ([0, 1], [1, 5], [3])
+
+
+def test_equity_funds_are_not_taxed():
+    prices = np.array([[1.0, 1.0], [1.0, 1.0], [2.0, 2.0], [2.0, 2.0]])
+    targets = [0, 0, CASH, CASH]
+    model = ExecutionModel(default_settlement_days=0, fund_types={'EQ': 'equity'})
+    assert execute(targets, prices, ['EQ', 'BD'], 100.0, model)['taxes'] == 0
+    assert execute(targets, prices, ['BD', 'EQ'], 100.0, model)['taxes'] == 10.0
@@ -0,0 +1,26 @@
+import portfolio_store
+
+
+def test_concurrent_writers_lose_no_updates(tmp_path):
+    writers, updates = 8, 20
+    ledger, log_lines, reads = portfolio_store.stress_test(str(tmp_path), writers=writers, updates=updates, readers=2)
+
+    expected = writers * updates
+    assert len(ledger) == expected
+    assert len({entry['id'] for entry in ledger}) == expected
+    assert len(log_lines) == expected
+
+
+def test_failed_transaction_is_not_committed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    try:
+        with portfolio_store.transaction(1) as txn:
+            txn.ledger.append({"portfolio_id": 1, "id": txn.next_id(), "symbol": "AAA",
+                               "date": "2024-01-02", "type": "buy", "quantity": 1})
+            txn.log("Buy Fund 1 of AAA on 2024-01-02")
+            raise RuntimeError("abort")
+    except RuntimeError:
+        pass
+
+    assert portfolio_store.read_portfolio(1) == []
+    assert not (tmp_path / portfolio_store.LOG_PATH).exists()
@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+import fund_store
+
+# Trading calendar kept as a sorted array of date ordinals. Lookups are binary
+# searches, so next/previous trading day and range queries cost O(log n).
+
+# Longest stretch of calendar days without trading (long Bayram holidays)
+MAX_HOLIDAY_GAP_DAYS = 10
+
+
+def _to_ordinal(day):
+    return day if isinstance(day, (int, np.integer)) else day.toordinal()
+
+
+def weekday_ordinals(start_date, end_date):
+    ordinals = np.arange(_to_ordinal(start_date), _to_ordinal(end_date) + 1, dtype=np.int32)
+    # Ordinal 1 (0001-01-01) is a Monday
+    return ordinals[(ordinals + 6) % 7 < 5]
+
+
+class TradingCalendar:
+    def __init__(self, ordinals):
+        self.ordinals = np.unique(np.asarray(ordinals, dtype=np.int32))
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    # Function to find the last trading day on or before (or strictly before) day
+    def previous_trading_day(self, day, inclusive=True):
+        side = 'right' if inclusive else 'left'
+        index = np.searchsorted(self.ordinals, _to_ordinal(day), side=side) - 1
+        if index < 0:
+            return None
+        return date.fromordinal(int(self.ordinals[index]))
+
+    # Function to get the trading day ordinals in [start_date, end_date]
+    def ordinals_between(self, start_date, end_date):
+        first = np.searchsorted(self.ordinals, _to_ordinal(start_date), side='left')
+        last = np.searchsorted(self.ordinals, _to_ordinal(end_date), side='right')
+        return self.ordinals[first:last]
+
+    def count(self, start_date, end_date):
+        return len(self.ordinals_between(start_date, end_date))
+
+
+# Function to build the TEFAS calendar: every date any stored fund has a price for,
+# with plain weekdays standing in before the first and after the last observed date
+def build_trading_calendar(start_date=None, end_date=None):
+    observed = [dates for dates in map(fund_store.read_dates, fund_store.list_symbols()) if dates is not None]
+    observed = np.unique(np.concatenate(observed)) if observed else np.empty(0, dtype=np.int32)
+
+    start_date = start_date or date.today() - timedelta(days=10 * 365)
+    end_date = end_date or date.today() + timedelta(days=365)
+    if len(observed) == 0:
+        return TradingCalendar(weekday_ordinals(start_date, end_date))
+
+    # Holidays never close the market for this long; longer holes in the observed
+    # dates are data we failed to fetch, so weekdays stand in for them as well
+    parts = [weekday_ordinals(start_date, int(observed[0]) - 1), observed]
+    for gap in np.flatnonzero(np.diff(observed) > MAX_HOLIDAY_GAP_DAYS):
+        parts.append(weekday_ordinals(int(observed[gap]) + 1, int(observed[gap + 1]) - 1))
+    parts.append(weekday_ordinals(int(observed[-1]) + 1, end_date))
+    return TradingCalendar(np.concatenate(parts))
+
+
+_calendar = None
+
+
+# Function to get the shared TEFAS calendar, built once per process
+def get_trading_calendar(refresh=False):
+    global _calendar
+    if _calendar is None or refresh:
+        _calendar = build_trading_calendar()
+    return _calendar
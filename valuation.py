@@ -0,0 +1,131 @@
+from datetime import date
+
+import numpy as np
+
+import fund_store
+from records import load_transactions
+from trading_calendar import get_trading_calendar
+
+# Portfolio valuation over time. The transaction ledger becomes a holdings
+# matrix (trading days x symbols) that is multiplied with the aligned price
+# panel, so the whole equity curve comes out of a handful of array operations.
+
+# Iterations of Newton's method when solving for the money-weighted return
+IRR_ITERATIONS = 50
+IRR_TOLERANCE = 1e-10
+
+
+# Function to align each symbol's prices to the given date ordinals, carrying
+# the last known price forward over days the fund has no price for
+def aligned_price_panel(symbols, ordinals):
+    panel = np.full((len(ordinals), len(symbols)), np.nan)
+    for column, symbol in enumerate(symbols):
+        columns = fund_store.cached_columns(symbol)
+        if columns is None or len(columns['date']) == 0:
+            continue
+        index = np.searchsorted(columns['date'], ordinals, side='right') - 1
+        known = index >= 0
+        panel[known, column] = columns['price'][index[known]]
+    return panel
+
+
+# Function to turn transactions into a signed quantity matrix (trading days x symbols).
+# Transactions on non-trading days are booked on the next trading day.
+def ledger_to_flows(transactions, symbols, ordinals):
+    flows = np.zeros((len(ordinals), len(symbols)))
+    symbol_index = {symbol: column for column, symbol in enumerate(symbols)}
+
+    transactions = [transaction for transaction in transactions if transaction.symbol in symbol_index]
+    if not transactions:
+        return flows
+
+    rows = np.searchsorted(ordinals, [transaction.date for transaction in transactions])
+    columns = np.array([symbol_index[transaction.symbol] for transaction in transactions])
+    quantities = np.array([transaction.signed_quantity for transaction in transactions], dtype=np.float64)
+
+    booked = rows < len(ordinals)
+    np.add.at(flows, (rows[booked], columns[booked]), quantities[booked])
+    return flows
+
+
+# Function to compute drawdown from the running peak of an equity curve or return index
+def drawdown(equity):
+    peaks = np.maximum.accumulate(equity)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(peaks > 0, equity / peaks - 1.0, 0.0)
+
+
+# Function to chain daily returns net of external cash flows (time-weighted return)
+def time_weighted_return(equity, cash_flows):
+    previous = equity[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily = np.where(previous > 0, (equity[1:] - cash_flows[1:]) / previous - 1.0, 0.0)
+    return float(np.prod(1.0 + daily) - 1.0), daily
+
+
+# Function to solve for the annualized internal rate of return (money-weighted return)
+def money_weighted_return(ordinals, cash_flows, final_value):
+    # Investor's view: buys are paid in (negative), the final value is received
+    flow_days = np.flatnonzero(cash_flows)
+    if len(flow_days) == 0 or final_value <= 0:
+        return None
+    amounts = np.append(-cash_flows[flow_days], final_value)
+    years = (np.append(ordinals[flow_days], ordinals[-1]) - ordinals[flow_days[0]]) / 365.0
+
+    rate = 0.1
+    for _ in range(IRR_ITERATIONS):
+        discount = (1.0 + rate) ** -years
+        value = np.sum(amounts * discount)
+        derivative = np.sum(-years * amounts * discount / (1.0 + rate))
+        if derivative == 0:
+            return None
+        step = value / derivative
+        rate = max(rate - step, -0.9999)
+        if abs(step) < IRR_TOLERANCE:
+            return float(rate)
+    return None
+
+
+# Function to value a portfolio ledger (portfolio file entries) on every trading day from the first transaction up to end_date
+def value_portfolio(ledger, end_date=None, calendar=None):
+    if calendar is None:
+        calendar = get_trading_calendar()
+    end_date = end_date or date.today()
+
+    transactions = load_transactions(ledger)
+    if not transactions:
+        return None
+
+    start_ordinal = min(transaction.date for transaction in transactions)
+    ordinals = calendar.ordinals_between(start_ordinal, end_date)
+    if len(ordinals) == 0:
+        return None
+
+    symbols = sorted({transaction.symbol for transaction in transactions})
+    prices = aligned_price_panel(symbols, ordinals)
+    flows = ledger_to_flows(transactions, symbols, ordinals)
+    holdings = np.cumsum(flows, axis=0)
+
+    # Positions without any price yet are valued at zero
+    known_prices = np.nan_to_num(prices)
+    values = holdings * known_prices
+    equity = values.sum(axis=1)
+    cash_flows = (flows * known_prices).sum(axis=1)
+
+    twr, daily_returns = time_weighted_return(equity, cash_flows)
+    # Drawdown is measured on the flow-neutral index, so selling units is not a loss
+    growth_index = np.concatenate([[1.0], np.cumprod(1.0 + daily_returns)])
+    return {
+        'symbols': symbols,
+        'dates': ordinals,
+        'holdings': holdings,
+        'prices': prices,
+        'values': values,
+        'equity': equity,
+        'cash_flows': cash_flows,
+        'daily_returns': daily_returns,
+        'growth_index': growth_index,
+        'drawdown': drawdown(growth_index),
+        'time_weighted_return': twr,
+        'money_weighted_return': money_weighted_return(ordinals, cash_flows, equity[-1]),
+    }